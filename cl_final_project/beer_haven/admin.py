@@ -1,13 +1,190 @@
-from django.contrib import admin
-from .models import Recipe, Ingredient, Category, ExperienceTip, Dictionary, RecipeIngredient, Profile, UserAddress, UserOrderItem, GuestOrderItem, GuestOrder, UserOrder
+import io
+import os
+
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.forms.models import BaseInlineFormSet
+from .pagination import ApproximateCountPaginator
+from .signals import batched_recipe_updates
+from .catalogue import CatalogueImportError, import_catalogue
+from .forms import IngredientImportForm
+from .models import Recipe, Ingredient, Category, ExperienceTip, Dictionary, RecipeIngredient, Profile, UserAddress, UserOrderItem, GuestOrderItem, GuestOrder, UserOrder, CustomerOrder, CustomerOrderItem, OutboxEmail, PaymentEvent, ThumbnailTask
 # Register your models here.
 
 
 
 
 # https://docs.djangoproject.com/en/4.2/ref/contrib/admin/
-class RecipeIngredientInline(admin.TabularInline):
+class LargeTablePaginator(ApproximateCountPaginator):
+    """ Changelist paginator which takes the planner's estimate instead of COUNT(*) for large results.
+        Pages past an estimate below the real count are still served (ApproximateCountPaginator.page)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, count_strategy='estimate_large', **kwargs)
+
+
+class RangeListFilter(admin.SimpleListFilter):
+    """ Filter by fixed ranges of a numeric field. Unlike list_filter on the field itself it does not
+        query distinct values of the whole table. ranges: (label, low, high), None means unbounded."""
+    field = None
+    ranges = []
+
+    def lookups(self, request, model_admin):
+        return [(str(number), label) for number, (label, _, _) in enumerate(self.ranges)]
+
+    def queryset(self, request, queryset):
+        if self.value() is None or not self.value().isdigit() or int(self.value()) >= len(self.ranges):
+            return queryset
+        _, low, high = self.ranges[int(self.value())]
+        if low is not None:
+            queryset = queryset.filter(**{f'{self.field}__gte': low})
+        if high is not None:
+            queryset = queryset.filter(**{f'{self.field}__lt': high})
+        return queryset
+
+
+class PriceRangeFilter(RangeListFilter):
+    title = 'price'
+    parameter_name = 'price_range'
+    field = 'price'
+    ranges = [('below 10', None, 10), ('10 - 50', 10, 50), ('50 - 200', 50, 200), ('200 and more', 200, None)]
+
+
+class VotesRangeFilter(RangeListFilter):
+    title = 'votes'
+    parameter_name = 'votes_range'
+    field = 'votes'
+    ranges = [('below 10', None, 10), ('10 - 100', 10, 100), ('100 and more', 100, None)]
+
+
+class OrderTotalRangeFilter(RangeListFilter):
+    title = 'total'
+    parameter_name = 'total_range'
+    field = 'total'
+    ranges = [('below 100', None, 100), ('100 - 500', 100, 500), ('500 and more', 500, None)]
+
+
+class OrderAdmin(admin.ModelAdmin):
+    """ Base of order changelists, which grow without limit: the count is estimated for large results
+        and the unfiltered total (a second COUNT(*)) is not shown."""
+    paginator = LargeTablePaginator
+    show_full_result_count = False
+    list_filter = ['paid', 'created', OrderTotalRangeFilter]
+
+
+class PrefetchedAutocompleteSelect(AutocompleteSelect):
+    """ Autocomplete widget which renders the selected option from `labels` (filled by the inline form
+        from the select_related object) instead of querying it again for every inline row. """
+    labels = {}
+
+    def optgroups(self, name, value, attr=None):
+        selected = {str(v) for v in value if v not in (None, '')}
+        if not selected or not selected <= set(self.labels):
+            return super().optgroups(name, value, attr)
+        options = [] if self.is_required else [self.create_option(name, '', '', False, 0)]
+        for key in selected:
+            options.append(self.create_option(name, key, self.labels[key], True, len(options)))
+        return [(None, options, 0)]
+
+
+class RecipeIngredientInlineForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            for name in ('recipe', 'ingredient'):
+                field = self.fields.get(name)
+                widget = getattr(field, 'widget', None)
+                # admin wraps the widget with the add / change related links
+                widget = getattr(widget, 'widget', widget)
+                if isinstance(widget, PrefetchedAutocompleteSelect):
+                    widget.labels = {str(getattr(self.instance, f'{name}_id')): str(getattr(self.instance, name))}
+
+
+class RecipeIngredientInlineFormSet(BaseInlineFormSet):
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        # an unchanged existing row is not saved, validating it would query its recipe and ingredient -
+        # with empty_permitted Form.full_clean skips it like an untouched extra row
+        if self.is_bound and index is not None and index < self.initial_form_count():
+            kwargs['empty_permitted'] = True
+        return kwargs
+
+
+class CappedInlineFormSet(RecipeIngredientInlineFormSet):
+    """ Shows at most max_rows existing rows, older ones cannot be edited from the page.
+        A posted page is matched with the rows it was rendered with (their ids), even if some of them
+        dropped out of the first max_rows in the meantime. """
+    max_rows = 50
+
+    def get_queryset(self):
+        if not hasattr(self, '_capped_queryset'):
+            queryset = super().get_queryset()
+            if self.is_bound:
+                pk = self.model._meta.pk.name
+                ids = [self.data.get(f'{self.add_prefix(index)}-{pk}') for index in range(self.initial_form_count())]
+                queryset = queryset.filter(pk__in=[value for value in ids if value and str(value).isdigit()])
+            else:
+                queryset = queryset[:self.max_rows]
+            self._capped_queryset = queryset
+        return self._capped_queryset
+
+
+class RecipeIngredientInlineBase(admin.TabularInline):
+    """ Recipe ingredient rows with an autocomplete widget instead of a <select> of the whole table.
+        The related objects are selected with the rows, so rendering takes one query however many
+        rows there are. Changes are saved in bulk by RecipeIngredientAdminMixin.save_formset. """
     model = RecipeIngredient
+    form = RecipeIngredientInlineForm
+    formset = RecipeIngredientInlineFormSet
+    extra = 1
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = PrefetchedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.autocomplete_fields)
+
+
+class RecipeIngredientInline(RecipeIngredientInlineBase):
+    autocomplete_fields = ['ingredient']
+
+
+class IngredientRecipeInline(RecipeIngredientInlineBase):
+    """ recipes using the ingredient, a popular one may be used by thousands - the newest rows are shown """
+    autocomplete_fields = ['recipe']
+    formset = CappedInlineFormSet
+    verbose_name_plural = f'recipes (newest {CappedInlineFormSet.max_rows} shown, edit older ones on their recipe pages)'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).order_by('-id')
+
+
+class RecipeIngredientAdminMixin:
+    """ Saves recipe ingredient inline rows with one INSERT, one UPDATE and one DELETE query, and updates
+        search vectors and rollups of all affected recipes once, see signals.batched_recipe_updates. """
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not RecipeIngredient:
+            return super().save_formset(request, form, formset, change)
+        with batched_recipe_updates() as recipe_ids:
+            instances = formset.save(commit=False)
+            new = [obj for obj in instances if obj.pk is None]
+            changed_fields = {name for obj, names in formset.changed_objects for name in names} - {'id', 'DELETE'}
+            RecipeIngredient.objects.bulk_create(new)
+            if changed_fields:
+                RecipeIngredient.objects.bulk_update([obj for obj, _ in formset.changed_objects], changed_fields)
+            if formset.deleted_objects:
+                RecipeIngredient.objects.filter(pk__in=[obj.pk for obj in formset.deleted_objects]).delete()
+            recipe_ids.update(obj.recipe_id for obj in instances + formset.deleted_objects)
+            # a row moved to another recipe changes the previous one too
+            recipe_ids.update(form.initial.get('recipe') for form in formset.initial_forms if 'recipe' in form.changed_data)
 
 
 class GuestOrderItemInline(admin.TabularInline):
@@ -18,9 +195,14 @@ class UserOrderItemInline(admin.TabularInline):
     model = UserOrderItem
 
 
+class CustomerOrderItemInline(admin.TabularInline):
+    model = CustomerOrderItem
+    autocomplete_fields = ['ingredient']
+
+
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(RecipeIngredientAdminMixin, admin.ModelAdmin):
     list_display = (
         'title',
         'slug',
@@ -31,14 +213,15 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     # fields connected to value of other fields
     prepopulated_fields = {"slug": ["title"]}
-    # list of filters in the right filter bar
-    list_filter = ['title', 'published', 'votes', 'status']
+    # list of filters in the right filter bar, high-cardinality fields are searched or filtered by ranges
+    list_filter = ['published', VotesRangeFilter, 'status']
+    search_fields = ['title']
     date_hierarchy = 'published'
     inlines = [RecipeIngredientInline]
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(RecipeIngredientAdminMixin, admin.ModelAdmin):
     list_display = (
         'name',
         'slug',
@@ -48,8 +231,43 @@ class IngredientAdmin(admin.ModelAdmin):
     )
 
     prepopulated_fields = {"slug": ["name"]}
-    list_filter = ['price', 'name', 'category']
-    inlines = [RecipeIngredientInline]
+    list_filter = [PriceRangeFilter, 'in_stock', 'category']
+    list_select_related = ['category']
+    search_fields = ['name']
+    autocomplete_fields = ['category']
+    inlines = [IngredientRecipeInline]
+    # adds the "Import supplier file" button
+    change_list_template = 'admin/beer_haven/ingredient/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='beer_haven_ingredient_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """ uploads a supplier file and applies it with catalogue.import_catalogue, like the import_ingredients command """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = IngredientImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = form.cleaned_data['format'] or os.path.splitext(upload.name)[1].lstrip('.').lower()
+            # uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE are in a temporary file and read in chunks
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                summary = import_catalogue(stream, file_format, dry_run=form.cleaned_data['dry_run'])
+            except (CatalogueImportError, UnicodeDecodeError) as error:
+                form.add_error('file', str(error))
+            else:
+                prefix = 'Dry run, nothing was saved. ' if form.cleaned_data['dry_run'] else ''
+                self.message_user(request, prefix + ' '.join(summary.lines()), messages.SUCCESS)
+                return redirect('admin:beer_haven_ingredient_changelist')
+        return TemplateResponse(request, 'admin/beer_haven/ingredient/import.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Import supplier file',
+            'opts': self.model._meta,
+            'form': form,
+        })
 
 
 @admin.register(Category)
@@ -59,7 +277,7 @@ class CategoryAdmin(admin.ModelAdmin):
         'slug'
     )
     prepopulated_fields = {"slug": ["name"]}
-    list_filter = ['name']
+    search_fields = ['name']
 
 
 @admin.register(ExperienceTip)
@@ -68,6 +286,8 @@ class ExperienceTipAdmin(admin.ModelAdmin):
         'recipe',
         'published'
     ]
+    list_select_related = ['recipe']
+    raw_id_fields = ['recipe']
 
 
 
@@ -78,32 +298,76 @@ class DictionaryAdmin(admin.ModelAdmin):
         'slug',
     ]
     prepopulated_fields = {"slug": ["title"]}
-    list_filter = ['title']
+    search_fields = ['title']
 
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'birthdate', 'avatar']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
 
 
 @admin.register(UserAddress)
 class UserAddressAdmin(admin.ModelAdmin):
     list_display = ['user', 'city', 'street', 'building_nr', 'apartment_nr', 'postal_code', 'is_shipping_addr', 'is_billing_addr']
+    list_select_related = ['user']
+    search_fields = ['city', 'street', 'user__username']
+    autocomplete_fields = ['user']
 
 
 @admin.register(UserOrder)
-class UserOrderAdmin(admin.ModelAdmin):
+class UserOrderAdmin(OrderAdmin):
     list_display = [
-        'user', 'billing_address', 'shipping_address', 'created', 'updated', 'paid'
+        'user', 'billing_address', 'shipping_address', 'created', 'updated', 'total', 'paid'
     ]
+    list_select_related = ['user', 'billing_address', 'shipping_address']
+    autocomplete_fields = ['user', 'billing_address', 'shipping_address']
     inlines = [UserOrderItemInline]
 
 
 @admin.register(GuestOrder)
-class GuestOrderAdmin(admin.ModelAdmin):
+class GuestOrderAdmin(OrderAdmin):
     list_display = [
-        'guest_first_name', 'guest_last_name', 'guest_email', 'guest_billing_address', 'guest_shipping_address', 'guest_postal_code','created', 'updated', 'paid'
+        'guest_first_name', 'guest_last_name', 'guest_email', 'guest_billing_address', 'guest_shipping_address', 'guest_postal_code','created', 'updated', 'total', 'paid'
     ]
+    search_fields = ['guest_email']
     inlines = [GuestOrderItemInline]
 
 
+@admin.register(CustomerOrder)
+class CustomerOrderAdmin(OrderAdmin):
+    """ guest and user orders of the single table layout in one changelist """
+    list_display = ['id', 'user', 'guest_email', 'shipping_address', 'created', 'updated', 'total', 'paid']
+    list_select_related = ['user', 'shipping_address']
+    search_fields = ['guest_email', 'user__username']
+    autocomplete_fields = ['user', 'billing_address', 'shipping_address']
+    inlines = [CustomerOrderItemInline]
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created', 'sent']
+    list_filter = ['status']
+
+
+@admin.register(ThumbnailTask)
+class ThumbnailTaskAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'source', 'status', 'attempts', 'next_attempt_at', 'created']
+    list_filter = ['status', 'model']
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'received', 'processed']
+    list_filter = ['type']
+
+    # raw events are append-only, use the replay_payment_events command to apply them again
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
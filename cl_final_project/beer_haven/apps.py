@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BeerHavenConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'beer_haven'
+
+    def ready(self):
+        # registers signal receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,89 @@
+import time
+
+from django.core.cache import cache
+
+# https://docs.djangoproject.com/en/4.2/topics/cache/#the-low-level-cache-api
+RECIPE_BODY_TIMEOUT = 60 * 60
+
+
+def _version_key(recipe_id):
+    return f'beer_haven:recipe:{recipe_id}:version'
+
+
+def _current_version(key):
+    """ A missing version (never set, invalidated or evicted) is replaced by a new unique one,
+        so an old fragment can never be picked up again."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def recipe_version(recipe_id):
+    """ current version of the cached recipe fragments """
+    return _current_version(_version_key(recipe_id))
+
+
+def invalidate_recipes(recipe_ids):
+    """ drops versions of given recipes, their cached fragments become unreachable """
+    cache.delete_many([_version_key(recipe_id) for recipe_id in set(recipe_ids)])
+
+
+def recipe_body_key(recipe_id):
+    return f'beer_haven:recipe:{recipe_id}:body:{recipe_version(recipe_id)}'
+
+
+RECENT_RECIPES_KEY = 'beer_haven:recent_recipes'
+RECENT_RECIPES_LOCK = 'beer_haven:recent_recipes:lock'
+# fresh for a minute, after that served stale until one worker refreshes it
+RECENT_RECIPES_TTL = 60
+RECENT_RECIPES_STALE_TIMEOUT = 24 * 60 * 60
+RECENT_RECIPES_LOCK_TIMEOUT = 30
+
+
+def _recent_recipes():
+    from .models import Recipe
+    # only the fields the landing page shows are loaded (and pickled)
+    return list(Recipe.objects.filter(status='PD').only('id', 'title', 'description')[:3])
+
+
+def refresh_recent_recipes():
+    recipes = _recent_recipes()
+    cache.set(RECENT_RECIPES_KEY, (time.time() + RECENT_RECIPES_TTL, recipes), RECENT_RECIPES_STALE_TIMEOUT)
+    return recipes
+
+
+def recent_recipes():
+    """ Recently published recipes for the landing page with stale-while-revalidate:
+        a fresh copy is returned straight from the cache, an expired one is recomputed only by the
+        worker which takes the lock (cache.add is atomic), the others keep returning the stale copy.
+        Only an empty cache (cold start, invalidation) makes every request compute it."""
+    cached = cache.get(RECENT_RECIPES_KEY)
+    if cached is None:
+        return refresh_recent_recipes()
+    fresh_until, recipes = cached
+    if time.time() < fresh_until or not cache.add(RECENT_RECIPES_LOCK, True, RECENT_RECIPES_LOCK_TIMEOUT):
+        return recipes
+    try:
+        return refresh_recent_recipes()
+    finally:
+        cache.delete(RECENT_RECIPES_LOCK)
+
+
+def invalidate_recent_recipes():
+    cache.delete(RECENT_RECIPES_KEY)
+
+
+DICTIONARY_VERSION_KEY = 'beer_haven:dictionary:version'
+DICTIONARY_PAGE_TIMEOUT = 60 * 60
+
+
+def dictionary_page_key(letter, page):
+    """ rendered dictionary listing of one letter (or all entries) and page number """
+    return f'beer_haven:dictionary:{_current_version(DICTIONARY_VERSION_KEY)}:{letter or "all"}:{page}'
+
+
+def invalidate_dictionary():
+    """ any change of an entry may move entries between pages, all cached pages are dropped """
+    cache.delete(DICTIONARY_VERSION_KEY)
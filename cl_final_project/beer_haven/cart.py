@@ -1,88 +1,140 @@
+from django.conf import settings
+
 from .models import Ingredient
 from decimal import Decimal
 
 
+class CartLimitError(Exception):
+    """Raised when a change would exceed CART_MAX_ITEMS lines or CART_MAX_AMOUNT of one ingredient."""
+
+
 class Cart:
+    """ Shopping cart kept in the session as parallel lists:
+        {'ids': [ingredient ids], 'amounts': [amounts], 'prices': [price snapshots as strings]}
+        The session is written only when the cart is modified. Ingredients are fetched
+        with one query the first time the cart is iterated and reused afterwards."""
+    session_key = 'cart'
+
     def __init__(self, request):
         """ Cart initialization via self.session will allow access for other methods of the Cart class.
-        We retrieve the shopping cart from the current session or create a new one when there is no existing
-        one in the session."""
+        We retrieve the shopping cart from the current session. Visitors without a cart
+        get an empty one which is stored in the session only after the first change."""
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        self.ids, self.amounts, self.prices = self.load(self.session.get(self.session_key))
+        self._items = None
+
+    @staticmethod
+    def load(data):
+        """ returns copies of the stored lists, also reads carts saved in the former
+            {"id": {"amount": .., "price": ..}} format"""
+        if not data:
+            return [], [], []
+        if 'ids' in data:
+            return list(data['ids']), list(data['amounts']), list(data['prices'])
+        ids = [int(ingredient_id) for ingredient_id in data]
+        amounts = [item['amount'] for item in data.values()]
+        prices = [item['price'] for item in data.values()]
+        return ids, amounts, prices
 
     def add(self, ingredient, amount=1, override_amount=False):
-        """A method that allows to add a product to cart or change the quantity of that product.
-        The dictionary uses the identifier of the ingredient as the key,
-        and the quantity of the product and its price as the value.
-
-        ingredient.id is converted to a text string because Django uses
-        JSON format for serializing session data. Decimal is also converted for the same reason"""
-        ingredient_id = str(ingredient.id)
-        if ingredient_id not in self.cart:
-            self.cart[ingredient_id] = {
-                'amount': 0,
-                'price': str(ingredient.price)
-            }
-        if override_amount:
-            self.cart[ingredient_id]['amount'] = amount
-        else:
-            self.cart[ingredient_id]['amount'] += amount
+        """A method that allows to add a product to cart or change the quantity of that product."""
+        self.add_many([(ingredient, amount)], override_amount)
+
+    def add_many(self, items, override_amount=False):
+        """ Adds (or with override_amount sets) amounts of many ingredients with one session write.
+            items are (ingredient, amount) pairs, an ingredient may repeat. A new ingredient gets its
+            current price as a snapshot, stored as string because Django uses JSON format for
+            serializing session data. Changes exceeding the payload limits raise CartLimitError
+            and leave the cart untouched."""
+        ids, amounts, prices = list(self.ids), list(self.amounts), list(self.prices)
+        positions = {ingredient_id: index for index, ingredient_id in enumerate(ids)}
+        for ingredient, amount in items:
+            index = positions.get(ingredient.id)
+            if index is None:
+                if len(ids) >= settings.CART_MAX_ITEMS:
+                    raise CartLimitError(f'The cart can hold up to {settings.CART_MAX_ITEMS} different ingredients.')
+                index = positions[ingredient.id] = len(ids)
+                ids.append(ingredient.id)
+                amounts.append(0)
+                prices.append(str(ingredient.price))
+            amounts[index] = amount if override_amount else amounts[index] + amount
+            if amounts[index] > settings.CART_MAX_AMOUNT:
+                raise CartLimitError(f'The amount of {ingredient.name} cannot exceed {settings.CART_MAX_AMOUNT}.')
+        self.ids, self.amounts, self.prices = ids, amounts, prices
         self.save()
 
+    def set_many(self, items):
+        """ sets amounts of many ingredients at once, see add_many() """
+        self.add_many(items, override_amount=True)
+
     def save(self):
-        """marking the session as modified, which will indicate, that it has been saved"""
+        """ stores the lists in the session (which marks it as modified) and drops hydrated items """
         # https://docs.djangoproject.com/en/4.2/topics/http/sessions/
-        self.session.modified = True
+        self.session[self.session_key] = {
+            'ids': list(self.ids),
+            'amounts': list(self.amounts),
+            'prices': list(self.prices),
+        }
+        self._items = None
 
     def remove(self, ingredient):
-        """ method removes the product from the cart dictionary based on the key (ingredient_id)
-            and calls the save method to update the cart in the session """
-        ingredient_id = str(ingredient.id)
-        if ingredient_id in self.cart:
-            del self.cart[ingredient_id]
-            self.save()
+        """ method removes the product from the cart based on the ingredient id """
+        self.remove_many([ingredient.id])
+
+    def remove_many(self, ingredient_ids):
+        """ removes all given ingredient ids and saves the cart in the session once """
+        ingredient_ids = set(ingredient_ids)
+        if ingredient_ids.isdisjoint(self.ids):
+            return
+        lines = [line for line in zip(self.ids, self.amounts, self.prices) if line[0] not in ingredient_ids]
+        self.ids, self.amounts, self.prices = (list(values) for values in zip(*lines)) if lines else ([], [], [])
+        self.save()
+
+    def hydrate(self):
+        """ Builds cart items with one Ingredient query. Items are plain dicts which are not
+            stored in the session, so views and templates may annotate them (e.g. with forms)
+            and iterate the cart any number of times without further queries.
+            Lines of ingredients removed from the shop are skipped."""
+        if self._items is None:
+            ingredients = Ingredient.objects.in_bulk(self.ids)
+            self._items = []
+            for ingredient_id, amount, price in zip(self.ids, self.amounts, self.prices):
+                if ingredient_id not in ingredients:
+                    continue
+                price = Decimal(price)
+                amount = Decimal(str(amount))
+                self._items.append({
+                    'ingredient': ingredients[ingredient_id],
+                    'price': price,
+                    'amount': amount,
+                    'total_price': price * amount,
+                })
+        return self._items
 
     def __iter__(self):
         """ method allows you to iterate through the products in the cart
-            and access the associated Ingredients model instances.
-            1.  Ingredient IDs (keys) are retrieved from the shopping cart
-            2.  Ingredient objects whose IDs are in the cart are retrieved.
-            3.  A copy of the shopping cart is created to avoid changing the original cart.
-            4.  In a "for" loop for each ingredient in the cart,
-                information about the corresponding Ingredient object is added
-                to the item in the cart, and price and total price calculations are performed.
-            5.  Finally, the items in the cart are returned during the iteration."""
-        ingredient_ids = self.cart.keys()
-        ingredients = Ingredient.objects.filter(id__in=ingredient_ids)
-        cart = self.cart.copy()
-        for ingredient in ingredients:
-            cart[str(ingredient.id)]['ingredient'] = ingredient
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['amount'] = Decimal(item['amount'])
-            item['total_price'] = item['price'] * item['amount']
-            yield item
+            together with the associated Ingredient model instances, see hydrate() """
+        return iter(self.hydrate())
+
+    def __len__(self):
+        return len(self.ids)
 
     def get_total_price(self):
-        """ method returns the total sum of the prices of all products in the shopping cart """
-        costs = [Decimal(item['price']) * Decimal(item['amount']) for item in self.cart.values()]
+        """ method returns the total sum of the prices of all products in the shopping cart, without queries """
+        costs = [Decimal(price) * Decimal(str(amount)) for amount, price in zip(self.amounts, self.prices)]
         return sum(costs)
 
     def clear(self):
         """ method removes the contents of the cart"""
-        del self.session['cart']
-        self.save()
-
-    def add_recipe(self, recipe):
-        """ method adds to cart all ingredients in given recipe"""
-        for ingredient in recipe.recipe_ingredients.all():
-            self.add(ingredient.ingredient, ingredient.amount)
-
-        # session_data = dict(self.session.items())
-        # print(session_data)
-
-
+        self.ids, self.amounts, self.prices = [], [], []
+        self._items = None
+        if self.session_key in self.session:
+            del self.session[self.session_key]
 
+    def add_recipe(self, recipe_ingredients, multiplier=1):
+        """ Adds all ingredients of a recipe. recipe_ingredients should come with select_related('ingredient'),
+            amounts are converted to the selling unit (see RecipeIngredient.cart_amount) and scaled by multiplier."""
+        self.add_many([
+            (recipe_ingredient.ingredient, recipe_ingredient.cart_amount(multiplier))
+            for recipe_ingredient in recipe_ingredients
+        ])
@@ -0,0 +1,203 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Ingredient, RecipeIngredient
+from .signals import batched_recipe_updates
+
+# columns of a supplier file, all but slug are optional
+FIELDS = ('price', 'in_stock', 'description')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+# unknown slugs and invalid rows listed in the summary, the rest is only counted
+SAMPLES = 20
+
+
+class CatalogueImportError(Exception):
+    """Raised for a file which cannot be read at all (unknown format, malformed JSON)."""
+
+
+class ImportSummary:
+    def __init__(self):
+        self.rows = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.fields = dict.fromkeys(FIELDS, 0)
+        self.unknown = []
+        self.unknown_count = 0
+        self.errors = []
+        self.error_count = 0
+        self.recipes = 0
+
+    def add_unknown(self, slug):
+        self.unknown_count += 1
+        if len(self.unknown) < SAMPLES:
+            self.unknown.append(slug)
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < SAMPLES:
+            self.errors.append(f'row {line}: {message}')
+
+    def lines(self):
+        yield (f'{self.rows} rows: {self.changed} ingredients changed, {self.unchanged} unchanged, '
+               f'{self.unknown_count} unknown slugs, {self.error_count} invalid rows')
+        yield 'changed ' + ', '.join(f'{field}: {count}' for field, count in self.fields.items())
+        yield f'rollups of {self.recipes} recipes updated'
+        if self.unknown:
+            yield 'unknown slugs: ' + ', '.join(self.unknown) + (' ...' if self.unknown_count > SAMPLES else '')
+        yield from self.errors
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """ yields objects of a JSON array one by one, reading the stream in chunks """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                started = True
+                buffer = buffer[1:]
+                continue
+            if buffer or eof:
+                raise CatalogueImportError('a JSON file has to contain an array of objects')
+        else:
+            if buffer.startswith(','):
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith(']'):
+                return
+            if buffer:
+                try:
+                    value, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    # the object continues in the next chunk
+                    if eof:
+                        raise CatalogueImportError('malformed JSON array')
+                else:
+                    yield value
+                    buffer = buffer[end:]
+                    continue
+            elif eof:
+                raise CatalogueImportError('unterminated JSON array')
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_json_lines(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                raise CatalogueImportError(f'malformed JSON line: {error}')
+
+
+def read_rows(stream, file_format):
+    """ yields (line number, row dict) of a text stream in csv, json (array) or jsonl format """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    readers = {'json': iter_json_array, 'jsonl': iter_json_lines}
+    if file_format not in readers:
+        raise CatalogueImportError(f'unknown format {file_format}, use one of csv, json, jsonl')
+    for number, row in enumerate(readers[file_format](stream), 1):
+        yield number, row
+
+
+def parse_row(row):
+    """ slug and the values of present FIELDS (empty cells are not changed), raises ValueError for invalid ones """
+    if not isinstance(row, dict):
+        raise ValueError('not an object')
+    slug = str(row.get('slug') or '').strip()
+    if not slug:
+        raise ValueError('missing slug')
+    values = {}
+    if row.get('price') not in (None, ''):
+        try:
+            values['price'] = Decimal(str(row['price'])).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'invalid price {row["price"]!r}')
+        if values['price'] < 0 or values['price'] >= 10000:
+            raise ValueError(f'price {values["price"]} out of range')
+    if row.get('in_stock') not in (None, ''):
+        in_stock = row['in_stock']
+        if not isinstance(in_stock, bool):
+            in_stock = str(in_stock).strip().lower()
+            if in_stock not in TRUE_VALUES | FALSE_VALUES:
+                raise ValueError(f'invalid in_stock {row["in_stock"]!r}')
+            in_stock = in_stock in TRUE_VALUES
+        values['in_stock'] = in_stock
+    if row.get('description') not in (None, ''):
+        values['description'] = str(row['description'])
+    return slug, values
+
+
+def apply_chunk(rows, summary):
+    """ Diffs one chunk of parsed rows (slug -> values) with a single query and updates changed ingredients
+        with one bulk_update. Returns ids of ingredients whose price or stock changed."""
+    ingredients = Ingredient.objects.filter(slug__in=rows).only('id', 'slug', *FIELDS)
+    found = set()
+    changed, fields, rollup_ids = [], set(), []
+    for ingredient in ingredients:
+        found.add(ingredient.slug)
+        changes = {field: value for field, value in rows[ingredient.slug].items() if getattr(ingredient, field) != value}
+        if not changes:
+            summary.unchanged += 1
+            continue
+        for field, value in changes.items():
+            setattr(ingredient, field, value)
+            summary.fields[field] += 1
+        changed.append(ingredient)
+        fields.update(changes)
+        if {'price', 'in_stock'} & set(changes):
+            rollup_ids.append(ingredient.id)
+    for slug in rows:
+        if slug not in found:
+            summary.add_unknown(slug)
+    if changed:
+        Ingredient.objects.bulk_update(changed, sorted(fields))
+        summary.changed += len(changed)
+    return rollup_ids
+
+
+def import_catalogue(stream, file_format, chunk_size=1000, dry_run=False):
+    """ Applies a supplier file (slug, price, in_stock, description) to ingredients with the same slug.
+        The file is read in chunks of chunk_size rows, so memory does not depend on its size. All chunks are
+        applied in one transaction, recipe rollups and cached recipe fragments are updated once at the end.
+        With dry_run the transaction is rolled back. Returns ImportSummary."""
+    summary = ImportSummary()
+    rows = read_rows(stream, file_format)
+    with transaction.atomic():
+        with batched_recipe_updates() as recipe_ids:
+            while True:
+                lines = list(islice(rows, chunk_size))
+                if not lines:
+                    break
+                chunk = {}
+                for line, row in lines:
+                    summary.rows += 1
+                    try:
+                        slug, values = parse_row(row)
+                    except ValueError as error:
+                        summary.add_error(line, error)
+                        continue
+                    # a slug repeated in the file - later rows override earlier ones
+                    chunk[slug] = {**chunk.get(slug, {}), **values}
+                rollup_ids = apply_chunk(chunk, summary) if chunk else []
+                if rollup_ids:
+                    recipe_ids.update(RecipeIngredient.objects.filter(ingredient_id__in=rollup_ids)
+                                      .values_list('recipe_id', flat=True).distinct())
+            summary.recipes = len(recipe_ids)
+        if dry_run:
+            transaction.set_rollback(True)
+    return summary
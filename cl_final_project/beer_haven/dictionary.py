@@ -0,0 +1,40 @@
+from string import ascii_uppercase
+
+from django.db.models import Count
+from django.db.models.functions import Left, Upper
+
+from .models import Dictionary
+
+LETTERS = list(ascii_uppercase)
+# entries starting with a digit, a symbol or a non-ASCII letter
+OTHER = '#'
+DICTIONARY_PAGE_SIZE = 50
+EXCERPT_LENGTH = 300
+
+
+def first_letter():
+    """ the expression of the dictionary_letter_idx index """
+    return Upper(Left('title', 1))
+
+
+def parse_letter(value):
+    value = (value or '').upper()
+    return value if value in LETTERS or value == OTHER else ''
+
+
+def filter_letter(queryset, letter):
+    queryset = queryset.annotate(letter=first_letter())
+    if letter == OTHER:
+        return queryset.exclude(letter__in=LETTERS)
+    return queryset.filter(letter=letter)
+
+
+def letter_index():
+    """ (letter, number of entries) of A-Z and OTHER, counted with a single grouped query """
+    counts = dict(
+        Dictionary.objects.annotate(letter=first_letter())
+        .order_by().values('letter').annotate(count=Count('id')).values_list('letter', 'count')
+    )
+    index = [(letter, counts.pop(letter, 0)) for letter in LETTERS]
+    index.append((OTHER, sum(counts.values())))
+    return index
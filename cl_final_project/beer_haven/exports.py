@@ -0,0 +1,93 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import GuestOrder, UserOrder, line_cost
+
+# one row per order line, orders without lines get a single row with empty line columns
+COLUMNS = [
+    'order_id', 'order_type', 'created', 'paid', 'order_total', 'customer', 'email',
+    'item_id', 'ingredient_id', 'ingredient', 'amount', 'price', 'cost',
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _line_columns():
+    """ item and ingredient columns of the order querysets, joined in the same query (LEFT JOIN) """
+    return {
+        'item_id': F('items__id'),
+        'ingredient_id': F('items__ingredient_id'),
+        'ingredient': F('items__ingredient__name'),
+        'amount': F('items__amount'),
+        'price': F('items__price'),
+        'cost': line_cost('items__'),
+    }
+
+
+def order_querysets(since, until):
+    """ guest and user order lines created in [since, until) as values() querysets with COLUMNS """
+    customers = {
+        GuestOrder: {
+            'order_type': Value('guest', output_field=CharField()),
+            'customer': Concat('guest_first_name', Value(' '), 'guest_last_name', output_field=CharField()),
+            'email': F('guest_email'),
+        },
+        UserOrder: {
+            'order_type': Value('user', output_field=CharField()),
+            'customer': F('user__username'),
+            'email': F('user__email'),
+        },
+    }
+    return [
+        model.objects.filter(created__gte=since, created__lt=until)
+        .values('created', 'paid', order_id=F('pk'), order_total=F('total'), **customer, **_line_columns())
+        .order_by('created', 'pk', 'items__id')
+        for model, customer in customers.items()
+    ]
+
+
+def export_rows(since, until, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Yields rows (dicts with COLUMNS) one by one. Each order type is read with a single query through
+        a server-side cursor, chunk_size rows at a time, so memory does not grow with the number of orders."""
+    # https://docs.djangoproject.com/en/4.2/ref/models/querysets/#with-server-side-cursors
+    for queryset in order_querysets(since, until):
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield row
+
+
+class Echo:
+    """ file-like object which returns what is written, for csv.writer in a generator """
+    # https://docs.djangoproject.com/en/4.2/howto/outputting-csv/#streaming-large-csv-files
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in COLUMNS])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in COLUMNS}, default=str) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
+
+
+def date_range(since, until=None):
+    """ [since, until] dates (until defaults to today) as aware datetimes of [since 00:00, day after until 00:00) """
+    until = until or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    end = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+    return start, end
@@ -0,0 +1,155 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+
+from .models import Category, Ingredient, Recipe, RecipeIngredient
+
+ABV_BUCKETS = {
+    '0-4': (0, 4),
+    '4-6': (4, 6),
+    '6-8': (6, 8),
+    '8+': (8, None),
+}
+VOTES_THRESHOLDS = [10, 50, 100]
+CATEGORY_LIMIT = 30
+INGREDIENT_LIMIT = 20
+FACET_COUNTS_TIMEOUT = 60
+
+
+def parse_filters(params):
+    """ Selected facet values from request.GET, unknown or malformed values are dropped:
+        category - category slugs (any of), abv - bucket keys (any of),
+        ingredient - ingredient id (contains), votes - minimal number of votes """
+    filters = {
+        'category': sorted(set(params.getlist('category'))),
+        'abv': sorted(set(params.getlist('abv')) & set(ABV_BUCKETS)),
+        'ingredient': None,
+        'votes': None,
+    }
+    ingredient = params.get('ingredient', '')
+    if ingredient.isdigit():
+        filters['ingredient'] = int(ingredient)
+    votes = params.get('votes', '')
+    if votes.isdigit() and int(votes) in VOTES_THRESHOLDS:
+        filters['votes'] = int(votes)
+    return filters
+
+
+def _abv_q(bucket):
+    low, high = ABV_BUCKETS[bucket]
+    q = Q(estimated_abv__gte=low)
+    if high is not None:
+        q &= Q(estimated_abv__lt=high)
+    return q
+
+
+def apply_filters(queryset, filters, exclude=None):
+    """ Filters recipes by all selected facets except `exclude`. Multi-valued relations are
+        matched with IN (subquery), so a recipe is never duplicated and no DISTINCT is needed."""
+    if filters['category'] and exclude != 'category':
+        queryset = queryset.filter(pk__in=Recipe.categories.through.objects.filter(
+            category__slug__in=filters['category']).values('recipe_id'))
+    if filters['abv'] and exclude != 'abv':
+        q = Q()
+        for bucket in filters['abv']:
+            q |= _abv_q(bucket)
+        queryset = queryset.filter(q)
+    if filters['ingredient'] is not None and exclude != 'ingredient':
+        queryset = queryset.filter(pk__in=RecipeIngredient.objects.filter(
+            ingredient_id=filters['ingredient']).values('recipe_id'))
+    if filters['votes'] is not None and exclude != 'votes':
+        queryset = queryset.filter(votes__gte=filters['votes'])
+    return queryset
+
+
+def _counts(queryset, facet, key, label, count=Count('*')):
+    """ one branch of the facet query, every branch has the columns facet, key, label, count """
+    return queryset.annotate(
+        facet=Value(facet, output_field=CharField()),
+        key=Cast(key, CharField()),
+        label=Cast(label, CharField()),
+    ).values('facet', 'key', 'label').annotate(count=count).values_list('facet', 'key', 'label', 'count')
+
+
+def facet_counts(recipes, filters):
+    """ Counts of all facet values with a single query - a UNION ALL of grouped branches.
+        Every facet is counted with the other facets' filters applied (its own selection does
+        not narrow its counts, so other values stay selectable). Votes are grouped into ranges and
+        summed up to "at least" counts here. Categories and ingredients are limited to the most used,
+        selected ones are always counted (after them), so they can be unselected."""
+    # https://docs.djangoproject.com/en/4.2/ref/models/querysets/#union
+    through = Recipe.categories.through.objects
+    abv_bucket = Case(*[When(_abv_q(bucket), then=Value(bucket)) for bucket in ABV_BUCKETS], output_field=CharField())
+    votes_range = Case(*[When(votes__gte=threshold, then=Value(threshold)) for threshold in reversed(VOTES_THRESHOLDS)],
+                       default=Value(0), output_field=IntegerField())
+    branches = [
+        _counts(through.filter(recipe__in=apply_filters(recipes, filters, 'category')),
+                'category', F('category__slug'), F('category__name')).order_by('-count', 'label')[:CATEGORY_LIMIT],
+        _counts(apply_filters(recipes, filters, 'abv'), 'abv', abv_bucket, Value('')).order_by(),
+        _counts(RecipeIngredient.objects.filter(recipe__in=apply_filters(recipes, filters, 'ingredient')),
+                'ingredient', F('ingredient_id'), F('ingredient__name'),
+                # an ingredient may be used more times in one recipe
+                Count('recipe_id', distinct=True)).order_by('-count', 'label')[:INGREDIENT_LIMIT],
+        _counts(apply_filters(recipes, filters, 'votes'), 'votes', votes_range, Value('')).order_by(),
+    ]
+    if filters['category']:
+        matching = apply_filters(recipes, filters, 'category')
+        branches.append(_counts(Category.objects.filter(slug__in=filters['category']), 'category', F('slug'),
+                                F('name'), Count('recipe_cat', filter=Q(recipe_cat__in=matching))).order_by())
+    if filters['ingredient'] is not None:
+        matching = apply_filters(recipes, filters, 'ingredient')
+        branches.append(_counts(Ingredient.objects.filter(pk=filters['ingredient']), 'ingredient', F('pk'), F('name'),
+                                Count('ingredient_recipes__recipe', distinct=True,
+                                      filter=Q(ingredient_recipes__recipe__in=matching))).order_by())
+    counts = {'category': {}, 'abv': {}, 'ingredient': {}, 'votes': {}}
+    for facet, key, label, count in branches[0].union(*branches[1:], all=True):
+        if facet in ('category', 'ingredient'):
+            # a selected value among the most used ones comes twice
+            counts[facet].setdefault(key, (key, label, count))
+        elif key is not None:
+            counts[facet][key] = count
+    return {
+        'category': list(counts['category'].values()),
+        'abv': [(bucket, f'{bucket} %', counts['abv'].get(bucket, 0)) for bucket in ABV_BUCKETS],
+        'ingredient': list(counts['ingredient'].values()),
+        'votes': [
+            (str(threshold), f'{threshold}+ votes',
+             sum(count for key, count in counts['votes'].items() if int(key) >= threshold))
+            for threshold in VOTES_THRESHOLDS
+        ],
+    }
+
+
+def cached_facet_counts(recipes, filters):
+    """ facet counts are shared by all visitors with the same selection for FACET_COUNTS_TIMEOUT seconds """
+    key = 'beer_haven:facets:' + hashlib.md5(repr(sorted(filters.items())).encode()).hexdigest()
+    counts = cache.get(key)
+    if counts is None:
+        counts = facet_counts(recipes, filters)
+        cache.set(key, counts, FACET_COUNTS_TIMEOUT)
+    return counts
+
+
+def facet_links(params, counts, filters):
+    """ Facet values with their counts, selection state and the url query which toggles them """
+    facets = {}
+    for facet, values in counts.items():
+        multiple = facet in ('category', 'abv')
+        selected_values = [str(value) for value in (filters[facet] if multiple else [filters[facet]]) if value is not None]
+        facets[facet] = []
+        for key, label, count in values:
+            query = params.copy()
+            for name in ('page', 'cursor'):
+                query.pop(name, None)
+            selected = key in selected_values
+            if multiple:
+                query.setlist(facet, [value for value in selected_values if value != key] + ([] if selected else [key]))
+            elif selected:
+                query.pop(facet, None)
+            else:
+                query[facet] = key
+            facets[facet].append({'key': key, 'label': label, 'count': count, 'selected': selected,
+                                  'query': query.urlencode()})
+    return facets
@@ -59,7 +59,10 @@ class UserRegistrationForm(forms.ModelForm):
 
 
 class SearchForm(forms.Form):
-    query = forms.CharField(label='')
+    query = forms.CharField(label='', widget=forms.TextInput(attrs={
+        'list': 'search-suggestions',
+        'autocomplete': 'off',
+    }))
 
 
 class UserProfileForm(forms.ModelForm):
@@ -84,6 +87,11 @@ class CartAddIngredientForm(forms.Form):
                                   widget=forms.HiddenInput)
 
 
+class CartAddRecipeForm(forms.Form):
+    # empty - the amounts given in the recipe (for its batch_volume)
+    litres = forms.FloatField(required=False, min_value=0.5, max_value=1000)
+
+
 class GuestOrderCreateForm(forms.ModelForm):
     guest_postal_code = PLPostalCodeField()
 
@@ -94,3 +102,23 @@ class GuestOrderCreateForm(forms.ModelForm):
             'guest_email', 'guest_billing_address',
             'guest_shipping_address', 'guest_postal_code'
         ]
+
+
+class IngredientImportForm(forms.Form):
+    file = forms.FileField(help_text='csv, json (array) or jsonl with slug and any of price, in_stock, description')
+    format = forms.ChoiceField(choices=[('', 'from the file extension'), ('csv', 'csv'), ('json', 'json'),
+                                        ('jsonl', 'jsonl')], required=False)
+    dry_run = forms.BooleanField(required=False, help_text='only report what would change')
+
+
+class OrderExportForm(forms.Form):
+    since = forms.DateField()
+    # empty - today
+    until = forms.DateField(required=False)
+    format = forms.ChoiceField(choices=[('csv', 'csv'), ('jsonl', 'jsonl')], required=False)
+
+    def clean(self):
+        cd = super().clean()
+        if cd.get('since') and cd.get('until') and cd['until'] < cd['since']:
+            raise ValidationError('until has to be after since')
+        return cd
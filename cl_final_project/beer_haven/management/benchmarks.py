@@ -0,0 +1,41 @@
+from decimal import Decimal
+from statistics import median
+from time import perf_counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from beer_haven.models import Category, Ingredient
+
+# Shared parts of the benchmark_* commands. They run in a transaction which is rolled back at the end.
+
+GUEST_DATA = {
+    'guest_first_name': 'Bench',
+    'guest_last_name': 'Mark',
+    'guest_email': 'bench@example.com',
+    'guest_shipping_address': 'Brewers street 1',
+    'guest_postal_code': '00-001',
+}
+
+
+def create_ingredients(count):
+    """ count ingredients in stock, in a category of their own """
+    category = Category.objects.create(name='benchmark', slug='benchmark')
+    return Ingredient.objects.bulk_create([
+        Ingredient(name=f'benchmark {i}', slug=f'benchmark-{i}', category=category,
+                   description='', in_stock=True, price=Decimal('9.99'))
+        for i in range(count)
+    ])
+
+
+def measure(function, repeat, prepare=None):
+    """ Runs function repeat times, returns the median latency in milliseconds and the number of queries
+        of one run. prepare() returns the arguments of every run, it is not measured."""
+    timings = []
+    for _ in range(repeat):
+        args = prepare() if prepare else ()
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            function(*args)
+            timings.append(perf_counter() - start)
+    return median(timings) * 1000, len(queries)
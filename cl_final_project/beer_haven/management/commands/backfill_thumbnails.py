@@ -0,0 +1,37 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from beer_haven.models import ThumbnailTask
+from beer_haven.thumbnails import THUMBNAILS
+
+
+class Command(BaseCommand):
+    help = ('Queues thumbnail tasks for existing images without up to date thumbnails, '
+            'run process_thumbnails afterwards (or keep it running with --loop).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=list(THUMBNAILS), help='defaults to all models')
+        parser.add_argument('--force', action='store_true', help='regenerate thumbnails of all images')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for label in options['model'] or THUMBNAILS:
+            field, _ = THUMBNAILS[label]
+            pending = set(ThumbnailTask.objects.filter(model=label, status='PG').values_list('object_id', 'source'))
+            images = (
+                apps.get_model(label).objects.exclude(**{field: ''})
+                .order_by('pk').values_list('pk', field, 'thumbnails')
+            )
+            tasks = []
+            queued = 0
+            for pk, source, thumbnails in images.iterator(chunk_size=options['batch_size']):
+                if (pk, source) in pending or (not options['force'] and (thumbnails or {}).get('source') == source):
+                    continue
+                tasks.append(ThumbnailTask(model=label, object_id=pk, source=source))
+                if len(tasks) == options['batch_size']:
+                    ThumbnailTask.objects.bulk_create(tasks)
+                    queued += len(tasks)
+                    tasks = []
+            ThumbnailTask.objects.bulk_create(tasks)
+            queued += len(tasks)
+            self.stdout.write(f'{label}: queued {queued} images')
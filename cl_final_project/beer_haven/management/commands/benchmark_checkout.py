@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from beer_haven.forms import GuestOrderCreateForm
+from beer_haven.management.benchmarks import GUEST_DATA, create_ingredients, measure
+from beer_haven.models import GuestOrderItem
+from beer_haven.orders import create_order_from_cart
+
+
+def legacy_checkout(form, cart):
+    """ order creation as it was done before: one create() (two INSERTs) per cart line, no transaction """
+    order = form.save()
+    for item in cart:
+        GuestOrderItem.objects.create(order=order, ingredient=item['ingredient'], price=item['price'], amount=item['amount'])
+    return order
+
+
+def bulk_checkout(form, cart):
+    return create_order_from_cart(form, cart, GuestOrderItem)
+
+
+class Command(BaseCommand):
+    help = 'Measures guest order creation latency and query count vs. cart size. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 50, 100, 250])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'lines':>6} {'legacy ms':>10} {'queries':>8} {'bulk ms':>10} {'queries':>8}")
+        with transaction.atomic():
+            ingredients = create_ingredients(max(options['sizes']))
+            for size in options['sizes']:
+                cart = [{'ingredient': ingredient, 'price': ingredient.price, 'amount': Decimal(1)}
+                        for ingredient in ingredients[:size]]
+
+                def prepare():
+                    form = GuestOrderCreateForm(GUEST_DATA)
+                    form.is_valid()
+                    return form, cart
+
+                legacy_ms, legacy_queries = measure(legacy_checkout, options['repeat'], prepare)
+                bulk_ms, bulk_queries = measure(bulk_checkout, options['repeat'], prepare)
+                self.stdout.write(f'{size:>6} {legacy_ms:>10.2f} {legacy_queries:>8} {bulk_ms:>10.2f} {bulk_queries:>8}')
+            transaction.set_rollback(True)
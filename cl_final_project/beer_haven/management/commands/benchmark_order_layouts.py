@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+
+from beer_haven.forms import GuestOrderCreateForm
+from beer_haven.management.benchmarks import GUEST_DATA, create_ingredients, measure
+from beer_haven.models import CustomerOrder, GuestOrder, GuestOrderItem, UserAddress, UserOrder
+from beer_haven.order_copy import copy_orders
+from beer_haven.order_layout import create_customer_order
+from beer_haven.orders import create_order_from_cart
+
+# orders shown on one changelist page (ModelAdmin.list_per_page)
+PAGE_SIZE = 100
+
+
+def mti_checkout(cart):
+    form = GuestOrderCreateForm(GUEST_DATA)
+    form.is_valid()
+    return create_order_from_cart(form, cart, GuestOrderItem)
+
+
+def single_table_checkout(cart):
+    return create_customer_order(GUEST_DATA, cart)
+
+
+def changelist(model, user):
+    """ renders the admin changelist of model the way a logged in staff user gets it """
+    # https://docs.djangoproject.com/en/4.2/topics/testing/advanced/#the-request-factory
+    request = RequestFactory().get(reverse(f'admin:beer_haven_{model._meta.model_name}_changelist'))
+    request.user = user
+    return admin.site._registry[model].changelist_view(request).render()
+
+
+def mti_listing(user):
+    """ orders of both types: a changelist per type, each joining the child table with Order """
+    changelist(GuestOrder, user)
+    changelist(UserOrder, user)
+
+
+def single_table_listing(user):
+    changelist(CustomerOrder, user)
+
+
+class Command(BaseCommand):
+    help = ('Compares the multi-table order layout (Order + GuestOrder / UserOrder) with the single table one '
+            '(CustomerOrder): checkout latency and query count vs. cart size, admin changelists of the orders. '
+            'All data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 50, 100])
+        parser.add_argument('--orders', type=int, default=500, help='orders of each type created for the listing')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def write_row(self, label, first, second):
+        self.stdout.write(f'{label:>12} {first[0]:>10.2f} {first[1]:>8} {second[0]:>10.2f} {second[1]:>8}')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        header = f"{'mti ms':>10} {'queries':>8} {'single ms':>10} {'queries':>8}"
+        with transaction.atomic():
+            ingredients = create_ingredients(max(options['sizes']))
+            self.stdout.write(f"{'cart lines':>12} {header}")
+            for size in options['sizes']:
+                cart = [{'ingredient': ingredient, 'price': ingredient.price, 'amount': Decimal(1)}
+                        for ingredient in ingredients[:size]]
+                self.write_row(size, measure(mti_checkout, repeat, lambda: (cart,)),
+                               measure(single_table_checkout, repeat, lambda: (cart,)))
+
+            user = User.objects.create_user('benchmark-orders')
+            address = UserAddress.objects.create(user=user, city='Benchmark', is_shipping_addr=True)
+            for _ in range(options['orders']):
+                GuestOrder.objects.create(**GUEST_DATA)
+                UserOrder.objects.create(user=user, billing_address=address, shipping_address=address)
+            copy_orders(apps, connection)
+            self.stdout.write(f"{'listing':>12} {header}")
+            admin_user = User.objects.create_superuser('benchmark-admin')
+            self.write_row(PAGE_SIZE, measure(mti_listing, repeat, lambda: (admin_user,)),
+                           measure(single_table_listing, repeat, lambda: (admin_user,)))
+            transaction.set_rollback(True)
@@ -0,0 +1,87 @@
+import hashlib
+import hmac
+import json
+import time
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from beer_haven.management.benchmarks import GUEST_DATA
+from beer_haven.models import GuestOrder, Order, PaymentEvent
+from beer_haven.webhooks import paid_order_id, process_events
+
+SECRET = 'whsec_benchmark'
+
+
+def signed_headers(payload, timestamp=None):
+    """ Stripe-Signature header the way Stripe builds it, https://stripe.com/docs/webhooks#verify-manually """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(SECRET.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return {'HTTP_STRIPE_SIGNATURE': f't={timestamp},v1={signature}'}
+
+
+def completed_event(number, order_id):
+    return {
+        'id': f'evt_benchmark_{number}',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'id': f'cs_benchmark_{number}', 'client_reference_id': str(order_id), 'payment_status': 'paid'}},
+    }
+
+
+def one_by_one():
+    """ the naive way: every event applied with its own queries """
+    for event in PaymentEvent.objects.filter(processed__isnull=True):
+        order_id = paid_order_id(event)
+        if order_id is not None:
+            order = Order.objects.get(pk=order_id)
+            order.paid = True
+            order.save()
+        event.processed = event.received
+        event.save()
+
+
+class Command(BaseCommand):
+    help = ('Sends a synthetic burst of signed checkout.session.completed webhooks (with redeliveries) to the '
+            'webhook endpoint and compares applying them one by one and in batches. All data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000)
+        parser.add_argument('--duplicates', type=float, default=0.1, help='part of events delivered twice')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def process(self, label, function):
+        PaymentEvent.objects.update(processed=None)
+        Order.objects.update(paid=False)
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            function()
+            elapsed = perf_counter() - start
+        self.stdout.write(f'{label:>12}: {elapsed * 1000:8.1f} ms, {len(queries)} queries, '
+                          f'{Order.objects.filter(paid=True).count()} orders paid')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(STRIPE_WEBHOOK_SECRET=SECRET, ALLOWED_HOSTS=['testserver']):
+            orders = [GuestOrder.objects.create(**GUEST_DATA) for _ in range(options['events'])]
+            payloads = [json.dumps(completed_event(number, order.id)) for number, order in enumerate(orders)]
+            payloads += payloads[:int(len(payloads) * options['duplicates'])]
+
+            client = Client()
+            timings = []
+            for payload in payloads:
+                start = perf_counter()
+                response = client.post(reverse('payment_webhook'), payload, content_type='application/json',
+                                       **signed_headers(payload))
+                timings.append(perf_counter() - start)
+                assert response.status_code == 200
+            timings.sort()
+            self.stdout.write(f'{len(payloads)} webhooks: median {timings[len(timings) // 2] * 1000:.2f} ms, '
+                              f'p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms, '
+                              f'{PaymentEvent.objects.count()} events stored')
+
+            self.process('one by one', one_by_one)
+            self.process('batched', lambda: process_events(options['batch_size']))
+            transaction.set_rollback(True)
@@ -0,0 +1,55 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from beer_haven.management.benchmarks import create_ingredients
+
+ENGINES = ['db', 'cached_db', 'cache', 'signed_cookies']
+
+
+def session_queries(queries):
+    """ returns (reads, writes) run against the django_session table """
+    statements = [query['sql'] for query in queries if 'django_session' in query['sql']]
+    writes = [sql for sql in statements if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))]
+    return len(statements) - len(writes), len(writes)
+
+
+class Command(BaseCommand):
+    help = ('Simulates anonymous cart traffic (view cart, add ingredients, view cart again) with every session '
+            'engine and reports session table reads / writes, latency and cookie size. All data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visitors', type=int, default=50)
+        parser.add_argument('--items', type=int, default=5, help='ingredients added to the cart by every visitor')
+
+    def visit(self, ingredients):
+        client = Client()
+        client.get(reverse('cart_details'))
+        for ingredient in ingredients:
+            client.post(reverse('cart_add', kwargs={'ingredient_id': ingredient.id}), {'amount': 1})
+        client.get(reverse('cart_details'))
+        client.get(reverse('cart_details'))
+        cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        return len(cookie.value) if cookie else 0
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'engine':>15} {'requests':>9} {'reads':>7} {'writes':>7} {'ms/request':>11} {'cookie B':>9}")
+        with transaction.atomic():
+            ingredients = create_ingredients(options['items'])
+            requests = options['visitors'] * (options['items'] + 3)
+            for engine in ENGINES:
+                with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}',
+                                       ALLOWED_HOSTS=['testserver']):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = perf_counter()
+                        cookie_sizes = [self.visit(ingredients) for _ in range(options['visitors'])]
+                        elapsed = perf_counter() - start
+                reads, writes = session_queries(queries)
+                self.stdout.write(f'{engine:>15} {requests:>9} {reads:>7} {writes:>7} '
+                                  f'{elapsed * 1000 / requests:>11.2f} {max(cookie_sizes):>9}')
+            transaction.set_rollback(True)
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from beer_haven.models import (Recipe, RecipeIngredient, Ingredient, Dictionary, ExperienceTip, Order, GuestOrder,
+                               GuestOrderItem, CustomerOrder, OutboxEmail, PaymentEvent)
+from beer_haven.search import search_recipes
+from beer_haven.dictionary import filter_letter
+
+
+def main_querysets():
+    """ the main queryset of every view (and worker), in the shape the view runs it """
+    published = Recipe.objects.filter(status='PD')
+    now = timezone.now()
+    return {
+        'index: recent recipes': published[:3],
+        'recipes list: page': published[:10],
+        'recipes list: keyset page': published.order_by('-published', 'id').filter(published__lt=now)[:11],
+        'recipes list: cheapest': published.order_by('ingredients_cost', 'id')[:10],
+        'recipe details': Recipe.objects.filter(pk=1),
+        'recipe details: ingredients': RecipeIngredient.objects.filter(recipe_id=1).select_related('ingredient'),
+        'recipe details: tips': ExperienceTip.objects.filter(recipe_id=1),
+        'recipe by slug': Recipe.objects.filter(slug='pale-ale'),
+        'search': search_recipes('pale ale')[:10],
+        'ingredients by name': Ingredient.objects.all()[:50],
+        'ingredient by slug': Ingredient.objects.filter(slug='pale-malt'),
+        'dictionary': Dictionary.objects.all()[:50],
+        'dictionary: letter': filter_letter(Dictionary.objects.all(), 'B')[:50],
+        'dictionary by slug': Dictionary.objects.filter(slug='ibu'),
+        'cart': Ingredient.objects.filter(id__in=[1, 2, 3]),
+        'payment: order': GuestOrder.objects.filter(pk=1),
+        'payment: line items': GuestOrderItem.objects.filter(order_id=1).select_related('ingredient'),
+        'admin: orders': Order.objects.all()[:100],
+        'admin: guest email search': GuestOrder.objects.filter(guest_email__icontains='brewer')[:100],
+        # the changelist adds -pk to Meta.ordering to make the order deterministic
+        'admin: customer orders': CustomerOrder.objects.select_related('user', 'shipping_address')
+                                                       .order_by('-created', '-pk')[:100],
+        'customer orders of a user': CustomerOrder.objects.filter(user_id=1)[:100],
+        'outbox worker': OutboxEmail.objects.filter(status='PG', next_attempt_at__lte=now).order_by('next_attempt_at')[:50],
+        'payment events worker': PaymentEvent.objects.filter(processed__isnull=True).order_by('id')[:500],
+    }
+
+
+def parse_plan(plan):
+    """ explain(format='json') returns the JSON document as text """
+    return json.loads(plan)[0]['Plan']
+
+
+def seq_scans(plan):
+    """ yields names of relations read with a sequential scan anywhere in the (JSON) plan """
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+
+def table_sizes(tables):
+    """ estimated number of rows, exact count for tables never analyzed (reltuples = -1) """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)', [list(tables)])
+        sizes = dict(cursor.fetchall())
+        for table, rows in sizes.items():
+            if rows < 0:
+                cursor.execute(f'SELECT count(*) FROM {connection.ops.quote_name(table)}')
+                sizes[table] = cursor.fetchone()[0]
+    return sizes
+
+
+class Command(BaseCommand):
+    help = ('Runs EXPLAIN on the main queryset of every view and fails when any of them reads a table '
+            'larger than --threshold rows with a sequential scan. Smaller tables are cheaper to scan, '
+            'run it against a database with production-like data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=10000, help='rows')
+
+    def handle(self, *args, **options):
+        # https://docs.djangoproject.com/en/4.2/ref/models/querysets/#explain
+        plans = {name: queryset.explain(format='json') for name, queryset in main_querysets().items()}
+        scans = {name: set(seq_scans(parse_plan(plan))) for name, plan in plans.items()}
+        sizes = table_sizes(set().union(*scans.values()))
+
+        failures = []
+        for name, tables in scans.items():
+            large = sorted(table for table in tables if sizes.get(table, 0) > options['threshold'])
+            if large:
+                failures.append(f'{name}: sequential scan of {", ".join(f"{table} ({int(sizes[table])} rows)" for table in large)}')
+            self.stdout.write(f'{"SEQ SCAN" if large else "ok":>8}  {name}')
+        if failures:
+            raise CommandError('\n'.join(failures))
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from beer_haven.exports import EXPORT_CHUNK_SIZE, FORMATS, date_range, export_rows
+
+
+class Command(BaseCommand):
+    help = ('Exports guest and user order lines created between --since and --until (inclusive dates) '
+            'as csv or jsonl for accounting. Rows are written while they are read, memory stays flat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, required=True, help='YYYY-MM-DD')
+        parser.add_argument('--until', type=date.fromisoformat, help='YYYY-MM-DD, defaults to today')
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', help='file path, defaults to standard output')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='rows fetched at once')
+
+    def handle(self, *args, **options):
+        lines, _ = FORMATS[options['format']]
+        since, until = date_range(options['since'], options['until'])
+        rows = export_rows(since, until, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines(rows))
+        else:
+            for line in lines(rows):
+                # lines already end with a line break
+                self.stdout.write(line, ending='')
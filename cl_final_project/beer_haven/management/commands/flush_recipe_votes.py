@@ -0,0 +1,12 @@
+from beer_haven.management.polling import PollingCommand
+from beer_haven.votes import flush_vote_counts
+
+
+class Command(PollingCommand):
+    help = 'Adds pending vote counts (RecipeVoteShard) to Recipe.votes and resets the shards.'
+    interval = 10
+    loop_help = 'keep flushing instead of exiting'
+
+    def process(self, **options):
+        updated = flush_vote_counts()
+        return f'updated votes of {updated} recipes' if updated else ''
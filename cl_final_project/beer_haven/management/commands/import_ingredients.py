@@ -0,0 +1,29 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from beer_haven.catalogue import CatalogueImportError, import_catalogue
+
+
+class Command(BaseCommand):
+    help = ('Updates ingredient price, in_stock and description from a supplier file (csv, json array or jsonl) '
+            'matched by slug. Only changed ingredients are written, recipe rollups are updated once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='rows diffed and updated at once')
+        parser.add_argument('--dry-run', action='store_true', help='report the changes without saving them')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        try:
+            # utf-8-sig drops the byte order mark spreadsheets put at the start of csv files
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                summary = import_catalogue(stream, file_format, options['chunk_size'], options['dry_run'])
+        except (OSError, CatalogueImportError) as error:
+            raise CommandError(error)
+        for line in summary.lines():
+            self.stdout.write(line)
+        if options['dry_run']:
+            self.stdout.write('dry run, nothing was saved')
@@ -0,0 +1,15 @@
+from beer_haven.management.polling import PollingCommand
+from beer_haven.webhooks import process_events
+
+
+class Command(PollingCommand):
+    help = 'Applies stored payment webhook events in batches, marking paid guest and user orders.'
+    loop_help = 'keep polling for new events instead of exiting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        super().add_arguments(parser)
+
+    def process(self, **options):
+        processed = process_events(options['batch_size'])
+        return f'processed {processed} events' if processed else ''
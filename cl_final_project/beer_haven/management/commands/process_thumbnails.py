@@ -0,0 +1,15 @@
+from beer_haven.management.polling import PollingCommand
+from beer_haven.thumbnails import process_thumbnails
+
+
+class Command(PollingCommand):
+    help = 'Generates WebP and JPEG thumbnails of uploaded recipe, ingredient and avatar images.'
+    loop_help = 'keep polling for new images instead of exiting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        super().add_arguments(parser)
+
+    def process(self, **options):
+        processed = process_thumbnails(options['batch_size'])
+        return f'processed {processed} images' if processed else ''
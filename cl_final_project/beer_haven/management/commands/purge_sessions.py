@@ -0,0 +1,39 @@
+from importlib import import_module
+from time import sleep
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Deletes expired sessions in batches. Unlike clearsessions (one DELETE of all expired rows) '
+            'every batch is a short statement of its own, so the table is never locked for long.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.1, help='seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        if not issubclass(engine.SessionStore, DBStore):
+            # cache and cookie sessions expire by themselves
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not store sessions in the database, nothing to purge.')
+            return
+
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # expire_date is indexed, each batch is found without a full scan and deleted by primary key
+            keys = list(
+                Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < options['batch_size']:
+                break
+            sleep(options['pause'])
+        self.stdout.write(f'Deleted {deleted} expired sessions.')
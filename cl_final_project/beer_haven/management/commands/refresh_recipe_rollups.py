@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from beer_haven.models import Recipe
+from beer_haven.rollups import update_recipe_rollups
+
+
+class Command(BaseCommand):
+    help = ('Recomputes ingredient cost / count / missing rollups of all recipes in batches. '
+            'Signals keep them up to date, this is for changes which bypass them (e.g. queryset.update()).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), options['batch_size']):
+            update_recipe_rollups(ids[start:start + options['batch_size']])
+        self.stdout.write(f'Refreshed {len(ids)} recipes.')
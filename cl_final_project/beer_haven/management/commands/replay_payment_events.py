@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from beer_haven.models import PaymentEvent
+from beer_haven.webhooks import record_events, process_events
+
+
+class Command(BaseCommand):
+    help = ('Applies payment events again. Stored events are selected by id and/or receive time, '
+            'missed ones can be loaded from a JSON lines file (e.g. exported from the Stripe dashboard). '
+            'Applying an event twice is harmless, a paid order stays paid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', nargs='+', default=[], help='event ids (evt_...)')
+        parser.add_argument('--since', help='events received at or after this date / datetime')
+        parser.add_argument('--file', help='JSON lines file with raw events to store')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not (options['event'] or options['since'] or options['file']):
+            raise CommandError('Give --event, --since or --file.')
+
+        if options['file']:
+            with open(options['file']) as file:
+                events = [json.loads(line) for line in file if line.strip()]
+            record_events(events)
+            options['event'] += [event['id'] for event in events]
+
+        events = PaymentEvent.objects.all()
+        if options['event']:
+            events = events.filter(event_id__in=options['event'])
+        if options['since']:
+            date = parse_date(options['since'])
+            since = datetime.combine(date, time.min) if date else parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f'Invalid --since: {options["since"]}')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            events = events.filter(received__gte=since)
+        replayed = events.update(processed=None)
+
+        processed = process_events(options['batch_size'])
+        self.stdout.write(f'replayed {replayed} events, processed {processed} events')
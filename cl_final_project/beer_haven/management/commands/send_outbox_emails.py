@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+from beer_haven.management.polling import PollingCommand
+from beer_haven.outbox import drain_outbox
+
+
+def drain_in_thread(batch_size):
+    try:
+        return drain_outbox(batch_size)
+    finally:
+        # every thread has its own database connection
+        connections.close_all()
+
+
+class Command(PollingCommand):
+    help = 'Sends queued emails from the outbox in batches, retrying failed ones with backoff.'
+    loop_help = 'keep polling the outbox instead of exiting when it is empty'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=1, help='number of threads draining the outbox')
+        super().add_arguments(parser)
+
+    def drain(self, batch_size, workers):
+        if workers == 1:
+            return drain_outbox(batch_size)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(drain_in_thread, [batch_size] * workers))
+
+    def process(self, **options):
+        processed = self.drain(options['batch_size'], options['workers'])
+        return f'processed {processed} emails' if processed else ''
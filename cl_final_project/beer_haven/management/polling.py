@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class PollingCommand(BaseCommand):
+    """ Base of the worker commands: process() runs once, or with --loop every --interval seconds.
+        It returns a progress message, written if not empty. """
+    interval = 5
+    loop_help = 'keep polling instead of exiting when there is nothing to do'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help=self.loop_help)
+        parser.add_argument('--interval', type=float, default=self.interval, help='seconds between polls in --loop mode')
+
+    def process(self, **options):
+        raise NotImplementedError('subclasses of PollingCommand must provide a process() method')
+
+    def handle(self, *args, **options):
+        while True:
+            message = self.process(**options)
+            if message:
+                self.stdout.write(message)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_search_vector(apps, schema_editor):
+    Recipe = apps.get_model('beer_haven', 'Recipe')
+    RecipeIngredient = apps.get_model('beer_haven', 'RecipeIngredient')
+
+    def names(queryset, name_field):
+        subquery = queryset.filter(recipe=OuterRef('pk')).values('recipe').annotate(
+            names=StringAgg(name_field, delimiter=' ')
+        ).values('names')
+        return Coalesce(Subquery(subquery), Value(''), output_field=TextField())
+
+    Recipe.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector(
+            names(Recipe.categories.through.objects, 'category__name'),
+            names(RecipeIngredient.objects, 'ingredient__name'),
+            weight='B', config='english'
+        )
+        + SearchVector('description', 'prep_description', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beer_haven', '0013_alter_userorder_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:41
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('beer_haven', 'Order')
+    amount = Func(F('amount'), template='(%(expressions)s)::text::numeric', output_field=models.DecimalField())
+    cost = Round(F('price') * amount, 2, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    for item_model in ('GuestOrderItem', 'UserOrderItem'):
+        items = apps.get_model('beer_haven', item_model).objects
+        totals = items.filter(order=OuterRef('pk')).values('order').annotate(total=Sum(cost)).values('total')
+        Order.objects.filter(pk__in=items.values('order')).update(
+            total=Coalesce(Subquery(totals), Value(Decimal('0.00')), output_field=models.DecimalField())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beer_haven', '0016_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beer_haven', '0017_order_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='batch_volume',
+            field=models.PositiveSmallIntegerField(default=20, help_text='litres of beer the ingredient amounts are given for', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
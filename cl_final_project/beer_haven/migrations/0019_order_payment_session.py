@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beer_haven', '0018_recipe_batch_volume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_expires',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_session_id',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_url',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
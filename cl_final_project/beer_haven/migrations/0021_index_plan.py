@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:51
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # indexes are built without locking the tables for writes, which is not possible inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('beer_haven', '0020_paymentevent'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='dictionary',
+            index=models.Index(fields=['title'], name='dictionary_title_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='experiencetip',
+            index=models.Index(fields=['recipe', '-published'], name='tip_recipe_published_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='guestorder',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('guest_email'), name='gin_trgm_ops'), name='guestorder_email_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['-created'], name='order_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('status', 'PD')), fields=['-published', 'id'], name='recipe_published_idx'),
+        ),
+    ]
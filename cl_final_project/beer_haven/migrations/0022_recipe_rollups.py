@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:55
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Func, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Ceil, Coalesce, Round
+
+
+def fill_recipe_rollups(apps, schema_editor):
+    Recipe = apps.get_model('beer_haven', 'Recipe')
+    RecipeIngredient = apps.get_model('beer_haven', 'RecipeIngredient')
+    amount = Func(F('amount'), template='(%(expressions)s)::text::numeric', output_field=models.DecimalField())
+    quantity = Case(
+        When(unit=0, then=Round(amount / 1000, 3)),
+        When(unit=2, then=Ceil(Round(amount, 6))),
+        default=Round(amount, 3),
+        output_field=models.DecimalField(),
+    )
+    lines = RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+    cost = lines.annotate(value=Sum(Round(F('ingredient__price') * quantity, 2))).values('value')
+    count = lines.annotate(value=Count('ingredient', distinct=True)).values('value')
+    missing = lines.annotate(value=Count('ingredient', distinct=True, filter=Q(ingredient__in_stock=False))).values('value')
+    Recipe.objects.filter(pk__in=RecipeIngredient.objects.values('recipe')).update(
+        ingredients_cost=Coalesce(Subquery(cost), Value(Decimal('0.00')), output_field=models.DecimalField()),
+        ingredients_count=Coalesce(Subquery(count), 0),
+        missing_ingredients=Coalesce(Subquery(missing), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beer_haven', '0021_index_plan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_cost',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='missing_ingredients',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('status', 'PD')), fields=['ingredients_cost', 'id'], name='recipe_cost_idx'),
+        ),
+        migrations.RunPython(fill_recipe_rollups, migrations.RunPython.noop),
+    ]
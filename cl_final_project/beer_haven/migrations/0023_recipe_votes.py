@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('beer_haven', '0022_recipe_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeVoteShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_shards', to='beer_haven.recipe')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_votes', to='beer_haven.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_votes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recipevoteshard',
+            constraint=models.UniqueConstraint(fields=('recipe', 'shard'), name='unique_recipe_vote_shard'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipevote',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user'), name='unique_recipe_vote'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:07
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('beer_haven', '0024_thumbnails'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='dictionary',
+            index=models.Index(django.db.models.functions.text.Upper(django.db.models.functions.text.Left('title', 1)), models.F('title'), name='dictionary_letter_idx'),
+        ),
+    ]
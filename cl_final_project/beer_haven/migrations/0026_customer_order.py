@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:19
+
+from decimal import Decimal
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('beer_haven', '0025_dictionary_letter_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('paid', models.BooleanField(default=False)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12)),
+                ('payment_session_id', models.CharField(blank=True, editable=False, max_length=255)),
+                ('payment_url', models.TextField(blank=True, editable=False)),
+                ('payment_expires', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('payment_attempts', models.PositiveSmallIntegerField(default=0, editable=False)),
+                ('guest_first_name', models.CharField(blank=True, max_length=64)),
+                ('guest_last_name', models.CharField(blank=True, max_length=64)),
+                ('guest_email', models.EmailField(blank=True, max_length=254)),
+                ('guest_billing_address', models.CharField(blank=True, max_length=255, null=True)),
+                ('guest_shipping_address', models.CharField(blank=True, max_length=255)),
+                ('guest_postal_code', models.CharField(blank=True, max_length=6)),
+                ('guest_city', models.CharField(blank=True, max_length=128, null=True)),
+                ('billing_address', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='beer_haven.useraddress')),
+                ('shipping_address', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='beer_haven.useraddress')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='customer_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='customer_order_items', to='beer_haven.ingredient')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='beer_haven.customerorder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='customerorder',
+            index=models.Index(fields=['-created'], name='customer_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerorder',
+            index=models.Index(condition=models.Q(('user__isnull', False)), fields=['user', '-created'], name='customer_order_user_idx'),
+        ),
+    ]
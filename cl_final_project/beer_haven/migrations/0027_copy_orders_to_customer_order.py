@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from beer_haven.order_copy import copy_orders, share_id_sequences, unshare_id_sequences
+
+
+def share_sequences(apps, schema_editor):
+    share_id_sequences(apps, schema_editor.connection)
+
+
+def unshare_sequences(apps, schema_editor):
+    unshare_id_sequences(apps, schema_editor.connection)
+
+
+def copy_to_customer_order(apps, schema_editor):
+    copy_orders(apps, schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    # every batch is committed separately, see order_copy.copy_orders
+    atomic = False
+
+    dependencies = [
+        ('beer_haven', '0026_customer_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(share_sequences, unshare_sequences),
+        migrations.RunPython(copy_to_customer_order, migrations.RunPython.noop),
+    ]
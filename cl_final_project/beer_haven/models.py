@@ -1,10 +1,15 @@
 # from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Func, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Left, Round, Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.conf import settings
 
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+from math import ceil
 
 # Create your models here.
 
@@ -19,6 +24,8 @@ class Recipe(models.Model):
     description = models.TextField()
     prep_description = models.TextField()
     estimated_abv = models.FloatField(default=0, validators=[MinValueValidator(0.0), MaxValueValidator(40.0)])
+    batch_volume = models.PositiveSmallIntegerField(default=20, validators=[MinValueValidator(1)],
+                                                    help_text='litres of beer the ingredient amounts are given for')
     votes = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
     published = models.DateTimeField(default=timezone.now)
@@ -26,12 +33,27 @@ class Recipe(models.Model):
     categories = models.ManyToManyField('Category', related_name='recipe_cat')
     status = models.CharField(max_length=2, choices=STATUS)
     image = models.ImageField(upload_to='beer_haven/recipes_img/', blank=True)
+    # resized copies of the image, written by the process_thumbnails command (see beer_haven.thumbnails)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    # denormalized full-text document, maintained by beer_haven.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+    # ingredient rollups maintained by beer_haven.signals (see beer_haven.rollups)
+    ingredients_cost = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
+    ingredients_count = models.PositiveIntegerField(default=0, editable=False)
+    missing_ingredients = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ['-published']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+            GinIndex(fields=['title'], name='recipe_title_trgm_idx', opclasses=['gin_trgm_ops']),
+            # published recipes newest first (index, list and keyset pages), drafts are not indexed
+            models.Index(fields=['-published', 'id'], condition=models.Q(status='PD'), name='recipe_published_idx'),
+            models.Index(fields=['ingredients_cost', 'id'], condition=models.Q(status='PD'), name='recipe_cost_idx'),
+        ]
 
 
 class Ingredient(models.Model):
@@ -39,6 +61,7 @@ class Ingredient(models.Model):
     slug = models.SlugField(max_length=128)
     category = models.ForeignKey('Category', related_name='ingredient_cat', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='beer_haven/ingredients_img/', blank=True)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField()
     in_stock = models.BooleanField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
@@ -48,6 +71,11 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            GinIndex(fields=['name'], name='ingredient_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            # trigram indexes cannot return rows in order
+            models.Index(fields=['name'], name='ingredient_name_idx'),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -64,6 +92,17 @@ class RecipeIngredient(models.Model):
     )
     unit = models.PositiveSmallIntegerField(choices=UNIT, default=0)
 
+    def cart_amount(self, multiplier=1):
+        """ Amount in the unit the ingredient is sold in: kilograms (grams are converted)
+            or whole pieces (rounded up, half a yeast packet cannot be bought)."""
+        amount = self.amount * multiplier
+        if self.unit == 0:
+            amount /= 1000
+        if self.unit == 2:
+            # rounded first, so float noise (e.g. 3.0000000000000004) does not add a piece
+            return float(ceil(round(amount, 6)))
+        return round(amount, 3)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=64, unique=True)
@@ -76,6 +115,35 @@ class Category(models.Model):
         ordering = ['name']
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
+        indexes = [
+            GinIndex(fields=['name'], name='category_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+
+class RecipeVote(models.Model):
+    """One vote of a user for a recipe. Recipe.votes is updated from RecipeVoteShard counters, see beer_haven.votes."""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='recipe_votes')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='recipe_votes')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'user'], name='unique_recipe_vote'),
+        ]
+
+
+class RecipeVoteShard(models.Model):
+    """Pending change of Recipe.votes split into a few rows per recipe, so concurrent votes lock different rows.
+    Shards are added to Recipe.votes and reset by the flush_recipe_votes command."""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='vote_shards')
+    shard = models.PositiveSmallIntegerField()
+    # negative when more votes were withdrawn than cast since the last flush
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'shard'], name='unique_recipe_vote_shard'),
+        ]
 
 
 class ExperienceTip(models.Model):
@@ -85,6 +153,9 @@ class ExperienceTip(models.Model):
 
     class Meta:
         ordering = ['-published']
+        indexes = [
+            models.Index(fields=['recipe', '-published'], name='tip_recipe_published_idx'),
+        ]
 
 
 class Dictionary(models.Model):
@@ -99,13 +170,19 @@ class Dictionary(models.Model):
         ordering = ['title']
         verbose_name = 'Dictionary'
         verbose_name_plural = 'Dictionaries'
+        indexes = [
+            GinIndex(fields=['title'], name='dictionary_title_trgm_idx', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['title'], name='dictionary_title_idx'),
+            # A-Z index and pages of one letter, see beer_haven.dictionary
+            models.Index(Upper(Left('title', 1)), 'title', name='dictionary_letter_idx'),
+        ]
 
 
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     birthdate = models.DateField(blank=True, null=True)
     avatar = models.ImageField(upload_to='beer_haven/user_profile/', blank=True)
-
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.user.username
@@ -130,20 +207,47 @@ class UserAddress(models.Model):
         verbose_name_plural = 'User addresses'
 
 
+CENT = Decimal('0.01')
+
+
+def float_as_decimal(field):
+    """ Float column as numeric through its shortest text form (same digits as Python str(float)),
+        so arithmetic on it gives the same results as Decimal(str(value)) in Python."""
+    return Func(F(field), template='(%(expressions)s)::text::numeric', output_field=models.DecimalField())
+
+
+def line_cost(prefix=''):
+    """ Database version of OrderItem.get_cost(), identical results thanks to float_as_decimal.
+        prefix is the path to the item from the queried model, e.g. 'items__'."""
+    return Round(F(f'{prefix}price') * float_as_decimal(f'{prefix}amount'), 2,
+                 output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
 class Order(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     paid = models.BooleanField(default=False)
+    # sum of items costs, maintained by OrderItemManager and signal receivers
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
+    # last checkout session of the payment gateway, reused while open (see payments.get_checkout_url)
+    payment_session_id = models.CharField(max_length=255, blank=True, editable=False)
+    payment_url = models.TextField(blank=True, editable=False)
+    payment_expires = models.DateTimeField(blank=True, null=True, editable=False)
+    payment_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['-created'], name='order_created_idx'),
+        ]
 
     def __str__(self):
         return f'order {self.id}'
 
     def get_total_cost(self):
-        cost = [item.get_cost() for item in self.items.all()]
-        return sum(cost)
+        """ total computed from items with a single aggregate query (stored one is in self.total) """
+        total = self.items.aggregate(total=Sum(line_cost()))['total']
+        return total if total is not None else Decimal('0.00')
 
 
 class GuestOrder(Order):
@@ -158,10 +262,11 @@ class GuestOrder(Order):
     def __str__(self):
         return f'order {self.id}'
 
-    def get_total_cost(self):
-        cost = [item.get_cost() for item in self.items.all()]
-        return sum(cost)
-
+    class Meta:
+        indexes = [
+            # admin search (icontains) compares UPPER(guest_email) with LIKE '%...%'
+            GinIndex(OpClass(Upper('guest_email'), name='gin_trgm_ops'), name='guestorder_email_trgm_idx'),
+        ]
 
 
 class UserOrder(Order):
@@ -181,6 +286,47 @@ class UserOrder(Order):
     #     return sum(cost)
 
 
+class OrderTotalsManager(models.Manager):
+    """Manager of order items which recomputes the stored total of their orders (order_model)."""
+    order_model = Order
+
+    def update_order_totals(self, order_ids):
+        """ recomputes total of given orders with one UPDATE """
+        totals = self.filter(order=OuterRef('pk')).values('order').annotate(total=Sum(line_cost())).values('total')
+        self.order_model.objects.filter(pk__in=order_ids).update(
+            total=Coalesce(Subquery(totals), Value(Decimal('0.00')), output_field=models.DecimalField())
+        )
+
+
+class OrderItemManager(OrderTotalsManager):
+    """Manager of OrderItem subclasses (GuestOrderItem, UserOrderItem)."""
+
+    def bulk_create_items(self, items, batch_size=500):
+        """ bulk_create() does not support multi-table inheritance, so the OrderItem rows are inserted
+            with bulk_create() and the child rows (pointer + order) with an explicit INSERT of unnested
+            arrays, batch_size rows per query. The order totals are updated with one more query.
+            Items get their ids, they are not reloaded."""
+        parents = OrderItem.objects.bulk_create([
+            OrderItem(ingredient_id=item.ingredient_id, amount=item.amount, price=item.price)
+            for item in items
+        ], batch_size=batch_size)
+        for item, parent in zip(items, parents):
+            item.id = item.orderitem_ptr_id = parent.id
+        connection = connections[self.db]
+        pointer, order = self.model._meta.pk, self.model._meta.get_field('order')
+        sql = (
+            f'INSERT INTO {connection.ops.quote_name(self.model._meta.db_table)} '
+            f'({connection.ops.quote_name(pointer.column)}, {connection.ops.quote_name(order.column)}) '
+            f'SELECT * FROM unnest(%s::{pointer.db_type(connection)}[], %s::{order.db_type(connection)}[])'
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                cursor.execute(sql, [[item.id for item in batch], [item.order_id for item in batch]])
+        self.update_order_totals({item.order_id for item in items})
+        return items
+
+
 class OrderItem(models.Model):
     ingredient = models.ForeignKey(Ingredient, on_delete=models.PROTECT, related_name='order_items')
     amount = models.FloatField(validators=[MinValueValidator(0)], default=0)
@@ -190,12 +336,148 @@ class OrderItem(models.Model):
         return str(self.id)
 
     def get_cost(self):
-        return self.price * Decimal(self.amount)
+        """ price * amount rounded to cents, str() avoids the binary expansion of the float amount """
+        return (self.price * Decimal(str(self.amount))).quantize(CENT, rounding=ROUND_HALF_UP)
 
 
 class GuestOrderItem(OrderItem):
     order = models.ForeignKey(GuestOrder, on_delete=models.CASCADE, related_name='items')
 
+    objects = OrderItemManager()
+
 
 class UserOrderItem(OrderItem):
-    order = models.ForeignKey(UserOrder, on_delete=models.CASCADE, related_name='items')
\ No newline at end of file
+    order = models.ForeignKey(UserOrder, on_delete=models.CASCADE, related_name='items')
+
+    objects = OrderItemManager()
+
+
+class CustomerOrder(models.Model):
+    """Single table layout of guest and user orders (see beer_haven.order_layout): a user order has user set,
+    a guest order has the guest fields. Reading an order is one table, saving it one INSERT."""
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    paid = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
+    payment_session_id = models.CharField(max_length=255, blank=True, editable=False)
+    payment_url = models.TextField(blank=True, editable=False)
+    payment_expires = models.DateTimeField(blank=True, null=True, editable=False)
+    payment_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True, related_name='customer_orders')
+    billing_address = models.ForeignKey(UserAddress, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    shipping_address = models.ForeignKey(UserAddress, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    guest_first_name = models.CharField(max_length=64, blank=True)
+    guest_last_name = models.CharField(max_length=64, blank=True)
+    guest_email = models.EmailField(blank=True)
+    guest_billing_address = models.CharField(max_length=255, blank=True, null=True)
+    guest_shipping_address = models.CharField(max_length=255, blank=True)
+    guest_postal_code = models.CharField(max_length=6, blank=True)
+    guest_city = models.CharField(max_length=128, blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['-created'], name='customer_order_created_idx'),
+            models.Index(fields=['user', '-created'], condition=models.Q(user__isnull=False), name='customer_order_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'order {self.id}'
+
+    @property
+    def is_guest(self):
+        return self.user_id is None
+
+
+class CustomerOrderItemManager(OrderTotalsManager):
+    order_model = CustomerOrder
+
+
+class CustomerOrderItem(models.Model):
+    order = models.ForeignKey(CustomerOrder, on_delete=models.CASCADE, related_name='items')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.PROTECT, related_name='customer_order_items')
+    amount = models.FloatField(validators=[MinValueValidator(0)], default=0)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = CustomerOrderItemManager()
+
+    def __str__(self):
+        return str(self.id)
+
+    def get_cost(self):
+        return (self.price * Decimal(str(self.amount))).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class OutboxEmail(models.Model):
+    """Email waiting to be sent by the `send_outbox_emails` management command.
+    next_attempt_at is both the retry time and the lease of a worker which took the message."""
+    STATUS = (
+        ('PG', 'Pending'),
+        ('ST', 'Sent'),
+        ('FL', 'Failed'),
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=2, choices=STATUS, default='PG')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.recipients)}'
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='PG'), name='outbox_pending_idx'),
+        ]
+
+
+class ThumbnailTask(models.Model):
+    """Image waiting for its thumbnails, processed by the `process_thumbnails` management command.
+    source is the name of the original file when the task was queued, a task for a replaced image is skipped."""
+    STATUS = (
+        ('PG', 'Pending'),
+        ('DN', 'Done'),
+        ('FL', 'Failed'),
+    )
+    model = models.CharField(max_length=64)
+    object_id = models.PositiveIntegerField()
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=2, choices=STATUS, default='PG')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}: {self.source}'
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='PG'), name='thumbnail_pending_idx'),
+        ]
+
+
+class PaymentEvent(models.Model):
+    """Raw payment gateway (Stripe) webhook event. Events are only appended by the webhook view and applied
+    later by the `process_payment_events` command, which sets processed. The unique event_id drops redeliveries."""
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=128)
+    payload = models.JSONField()
+    received = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.type} {self.event_id}'
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed__isnull=True), name='payment_event_pending_idx'),
+        ]
@@ -0,0 +1,123 @@
+from django.core.management.color import no_style
+from django.db import transaction
+
+# Copy of the multi-table order layout (Order + GuestOrder / UserOrder, OrderItem + GuestOrderItem /
+# UserOrderItem) into the single table one (CustomerOrder, CustomerOrderItem). Migration 0027 runs it,
+# so it uses only the model registry it gets (apps.get_model) - never import the app's models here.
+
+COPY_BATCH_SIZE = 1000
+ORDER_COLUMNS = ['id', 'created', 'updated', 'paid', 'total', 'payment_session_id', 'payment_url',
+                 'payment_expires', 'payment_attempts']
+USER_COLUMNS = ['user_id', 'billing_address_id', 'shipping_address_id']
+GUEST_COLUMNS = ['guest_first_name', 'guest_last_name', 'guest_email', 'guest_billing_address',
+                 'guest_shipping_address', 'guest_postal_code', 'guest_city']
+ITEM_COLUMNS = ['id', 'ingredient_id', 'amount', 'price']
+# single table layout -> multi-table layout whose id sequence it shares
+SHARED_SEQUENCES = [('CustomerOrder', 'Order'), ('CustomerOrderItem', 'OrderItem')]
+
+
+def _table(apps, connection, name):
+    return connection.ops.quote_name(apps.get_model('beer_haven', name)._meta.db_table)
+
+
+def share_id_sequences(apps, connection):
+    """ CustomerOrder and CustomerOrderItem take ids from the sequences of Order and OrderItem, so rows
+        created in either layout never get the same id - copied rows keep their ids and a later copy
+        never meets a row created in the single table layout."""
+    with connection.cursor() as cursor:
+        for target, source in SHARED_SEQUENCES:
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)',
+                           [apps.get_model('beer_haven', source)._meta.db_table, 'id'])
+            sequence, = cursor.fetchone()
+            cursor.execute(f'ALTER TABLE {_table(apps, connection, target)} ALTER COLUMN id DROP IDENTITY IF EXISTS, '
+                           f'ALTER COLUMN id SET DEFAULT nextval(%s::regclass)', [sequence])
+
+
+def unshare_id_sequences(apps, connection):
+    """ reverse of share_id_sequences: own identity columns starting after the current ids """
+    with connection.cursor() as cursor:
+        for target, _ in SHARED_SEQUENCES:
+            cursor.execute("SELECT is_identity FROM information_schema.columns WHERE table_name = %s AND column_name = 'id'",
+                           [apps.get_model('beer_haven', target)._meta.db_table])
+            if cursor.fetchone()[0] == 'NO':
+                cursor.execute(f'ALTER TABLE {_table(apps, connection, target)} ALTER COLUMN id DROP DEFAULT, '
+                               f'ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        models = [apps.get_model('beer_haven', target) for target, _ in SHARED_SEQUENCES]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def _copy_statements(apps, connection):
+    """ INSERT ... SELECT of one batch (rows with id > %s, at most %s of them) for every source table.
+        A row copied before is updated if its source changed since, the statement returns the last id
+        of the batch and the number of inserted or updated rows."""
+    quote = connection.ops.quote_name
+    customer_order = apps.get_model('beer_haven', 'CustomerOrder')
+
+    def table(name):
+        return _table(apps, connection, name)
+
+    def columns(alias, names):
+        return ', '.join(f'{alias}.{quote(name)}' for name in names)
+
+    def empty(names):
+        """ values of columns a source table does not have: NULL (typed, the batch is a CTE) or '' """
+        fields = [customer_order._meta.get_field(name.removesuffix('_id')) for name in names]
+        return ', '.join(f'NULL::{field.db_type(connection)}' if field.null else "''" for field in fields)
+
+    def statement(target, target_columns, select, source, source_id, condition=''):
+        changed = [column for column in target_columns if column != 'id']
+        return (
+            f'WITH batch AS (SELECT {select} FROM {source} WHERE {source_id} > %s {condition} '
+            f'ORDER BY {source_id} LIMIT %s), '
+            f'written AS (INSERT INTO {target} AS t ({", ".join(quote(column) for column in target_columns)}) '
+            f'SELECT * FROM batch ON CONFLICT (id) DO UPDATE SET ({", ".join(quote(column) for column in changed)}) '
+            f'= ({columns("EXCLUDED", changed)}) WHERE ({columns("t", changed)}) IS DISTINCT FROM '
+            f'({columns("EXCLUDED", changed)}) RETURNING 1) '
+            f'SELECT (SELECT max(id) FROM batch), (SELECT count(*) FROM written)'
+        )
+
+    orders, items = table('CustomerOrder'), table('CustomerOrderItem')
+    order_columns = ORDER_COLUMNS + USER_COLUMNS + GUEST_COLUMNS
+    item_columns = ITEM_COLUMNS + ['order_id']
+    # items of an order created after the orders were copied wait for the next run
+    copied_order = f'AND EXISTS (SELECT 1 FROM {orders} WHERE id = c.order_id)'
+    return [
+        ('guest orders', statement(
+            orders, order_columns,
+            f'{columns("o", ORDER_COLUMNS)}, {empty(USER_COLUMNS)}, {columns("c", GUEST_COLUMNS)}',
+            f'{table("Order")} o JOIN {table("GuestOrder")} c ON c.order_ptr_id = o.id', 'o.id')),
+        ('user orders', statement(
+            orders, order_columns,
+            f'{columns("o", ORDER_COLUMNS)}, {columns("c", USER_COLUMNS)}, {empty(GUEST_COLUMNS)}',
+            f'{table("Order")} o JOIN {table("UserOrder")} c ON c.order_ptr_id = o.id', 'o.id')),
+        ('guest order items', statement(
+            items, item_columns, f'{columns("i", ITEM_COLUMNS)}, c.order_id',
+            f'{table("OrderItem")} i JOIN {table("GuestOrderItem")} c ON c.orderitem_ptr_id = i.id', 'i.id',
+            copied_order)),
+        ('user order items', statement(
+            items, item_columns, f'{columns("i", ITEM_COLUMNS)}, c.order_id',
+            f'{table("OrderItem")} i JOIN {table("UserOrderItem")} c ON c.orderitem_ptr_id = i.id', 'i.id',
+            copied_order)),
+    ]
+
+
+def copy_orders(apps, connection, batch_size=COPY_BATCH_SIZE):
+    """ Copies orders and their items of the multi-table layout into CustomerOrder and CustomerOrderItem,
+        batch_size rows per statement, each batch in its own transaction - a large table is not locked
+        for the whole copy and an interrupted copy continues where it stopped.
+        It can be run again until the switch to the single table layout: new orders are copied and
+        copied ones updated from their source (paid, total, payment fields). Rows created in the single
+        table layout have ids of their own (share_id_sequences) and are never touched. Rows deleted in
+        the multi-table layout are not deleted. Returns {source: number of inserted or updated rows}."""
+    copied = {}
+    for source, sql in _copy_statements(apps, connection):
+        last_id, copied[source] = 0, 0
+        while True:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(sql, [last_id, batch_size])
+                last_id, written = cursor.fetchone()
+            if last_id is None:
+                break
+            copied[source] += written
+    return copied
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import CustomerOrder, CustomerOrderItem
+from .orders import lock_ingredients
+
+# Single table order layout (CustomerOrder, CustomerOrderItem) next to the multi-table one
+# (Order + GuestOrder / UserOrder, OrderItem + GuestOrderItem / UserOrderItem). Orders of the
+# multi-table layout are copied with their ids by order_copy.copy_orders, both layouts take ids
+# from the same sequences.
+
+
+def create_customer_order(order_data, cart):
+    """ Checkout on the single table layout, same steps as orders.create_order_from_cart: ingredients are
+        locked, the order (with its total computed from the lines) is one INSERT and the items another one."""
+    lines = [(item['ingredient'], item['price'], item['amount']) for item in cart]
+    items = [CustomerOrderItem(ingredient=ingredient, price=price, amount=float(amount))
+             for ingredient, price, amount in lines]
+    with transaction.atomic():
+        lock_ingredients([ingredient.id for ingredient, price, amount in lines])
+        order = CustomerOrder.objects.create(total=sum((item.get_cost() for item in items), Decimal('0.00')),
+                                             **order_data)
+        for item in items:
+            item.order = order
+        CustomerOrderItem.objects.bulk_create(items)
+    return order
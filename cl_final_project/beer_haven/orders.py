@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Ingredient
+
+
+class OutOfStockError(Exception):
+    """Raised when some cart ingredients are not in stock at the moment of ordering."""
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+        names = ', '.join(ingredient.name for ingredient in ingredients)
+        super().__init__(f'Ingredients not in stock: {names}')
+
+
+def lock_ingredients(ingredient_ids):
+    """ Locks ingredient rows with one SELECT ... FOR UPDATE (call it in a transaction), so their stock
+        cannot change until commit. Raises OutOfStockError if some of them are not in stock."""
+    # ordering by id gives the same lock order in concurrent checkouts
+    locked = Ingredient.objects.select_for_update().filter(id__in=ingredient_ids).order_by('id')
+    missing = [ingredient for ingredient in locked if not ingredient.in_stock]
+    if missing:
+        raise OutOfStockError(missing)
+
+
+def create_order_from_cart(order_form, cart, item_model):
+    """ Saves the order and all cart lines atomically.
+        1.  Ingredient rows of the whole cart are locked with one SELECT ... FOR UPDATE
+            and checked for `in_stock`, so the stock cannot change until commit.
+        2.  The order is saved from the (valid) form.
+        3.  All lines are inserted in bulk (two INSERT queries, see OrderItemManager)
+            and the order total is stored.
+        Any error rolls back the whole order."""
+    lines = [(item['ingredient'], item['price'], item['amount']) for item in cart]
+    with transaction.atomic():
+        lock_ingredients([ingredient.id for ingredient, price, amount in lines])
+
+        order = order_form.save()
+        items = item_model.objects.bulk_create_items([
+            item_model(order=order, ingredient=ingredient, price=price, amount=float(amount))
+            for ingredient, price, amount in lines
+        ])
+    # the same value bulk_create_items() stored in the database, no need to read it back
+    order.total = sum((item.get_cost() for item in items), Decimal('0.00'))
+    return order
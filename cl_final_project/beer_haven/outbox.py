@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+# https://docs.djangoproject.com/en/4.2/topics/email/#email-backends
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+
+def queue_email(subject, body, from_email, recipients):
+    """ Stores the email in the outbox. Called inside the transaction which created the data,
+        the email is only sent (by the worker) if that transaction commits."""
+    return OutboxEmail.objects.create(subject=subject, body=body, from_email=from_email, recipients=list(recipients))
+
+
+def backoff(attempts):
+    """ seconds to wait before the next attempt: 30s, 60s, 120s ... up to an hour """
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_due(model, batch_size, lease=LEASE):
+    """ Takes up to batch_size due rows of a queue model (status 'PG', next_attempt_at passed).
+        Rows locked by other workers are skipped and the claimed ones get their next_attempt_at
+        moved by lease, so a crashed worker's rows become due again instead of being lost.
+        Used by the outbox and by the thumbnail queue."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            model.objects.select_for_update(skip_locked=True)
+            .filter(status='PG', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        model.objects.filter(pk__in=[row.pk for row in batch]).update(next_attempt_at=now + lease)
+    return batch
+
+
+def claim_batch(batch_size):
+    """ takes up to batch_size due messages, see claim_due """
+    return claim_due(OutboxEmail, batch_size)
+
+
+def send_message(email, connection):
+    """ sends one message, a failed one is retried with backoff or given up after MAX_ATTEMPTS """
+    email.attempts += 1
+    message = EmailMessage(email.subject, email.body, email.from_email or None, email.recipients,
+                           connection=connection)
+    try:
+        message.send()
+    except Exception as error:
+        email.last_error = f'{type(error).__name__}: {error}'
+        if email.attempts >= MAX_ATTEMPTS:
+            email.status = 'FL'
+        else:
+            email.next_attempt_at = timezone.now() + timedelta(seconds=backoff(email.attempts))
+    else:
+        email.status = 'ST'
+        email.sent = timezone.now()
+        email.last_error = ''
+
+
+def send_batch(batch):
+    """ sends the batch over a single backend connection and stores results with one bulk update """
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        # server is unavailable, it is not the messages' fault - they are retried without counting an attempt
+        retry_at = timezone.now() + timedelta(seconds=BACKOFF_BASE)
+        for email in batch:
+            email.last_error = f'{type(error).__name__}: {error}'
+            email.next_attempt_at = retry_at
+    else:
+        try:
+            for email in batch:
+                send_message(email, connection)
+        finally:
+            connection.close()
+    OutboxEmail.objects.bulk_update(batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent'])
+
+
+def drain_outbox(batch_size=50):
+    """ sends due messages batch after batch until there are none, returns number of processed messages """
+    processed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return processed
+        send_batch(batch)
+        processed += len(batch)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+# https://docs.djangoproject.com/en/4.2/topics/pagination/
+
+def estimate_count(queryset):
+    """ row count estimated by the query planner, no table scan is done """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset, timeout=300):
+    """ exact count, computed at most once per `timeout` seconds for the same query """
+    key = 'count:' + hashlib.md5(str(queryset.order_by().query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def estimate_large_count(queryset, threshold=10000):
+    """ estimate of large results, exact count when the planner expects fewer than `threshold` rows """
+    estimate = estimate_count(queryset)
+    return estimate if estimate >= threshold else queryset.count()
+
+
+COUNT_STRATEGIES = {
+    'estimate': estimate_count,
+    'cached': cached_count,
+    'estimate_large': estimate_large_count,
+}
+
+
+class ApproximatePage(Page):
+    """ page of ApproximateCountPaginator, whether there is a next page is known from the rows fetched """
+
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+    def start_index(self):
+        return (self.number - 1) * self.paginator.per_page + 1 if self.object_list else 0
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self.object_list)
+
+
+class ApproximateCountPaginator(Paginator):
+    """ Offset paginator which takes the total from one of COUNT_STRATEGIES instead of COUNT(*).
+        The total is only shown: an estimate below the real count must not hide the last pages, so a
+        page is fetched with one row more than per_page to tell whether a next one exists. Orphans are
+        not supported."""
+
+    def __init__(self, *args, count_strategy='estimate', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+
+    @cached_property
+    def count(self):
+        return COUNT_STRATEGIES[self.count_strategy](self.object_list)
+
+    def validate_number(self, number):
+        """ unlike Paginator.validate_number pages above the estimated num_pages are valid """
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and (number > 1 or not self.allow_empty_first_page):
+            raise EmptyPage(_('That page contains no results'))
+        page = ApproximatePage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+        # page links reach at least the pages seen to exist
+        self.num_pages = max(self.num_pages, number + page.has_next())
+        return page
+
+
+class KeysetPage:
+    """ one page of KeysetPaginator, exposes the part of Page interface used by templates """
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """ Cursor (seek) pagination. Instead of OFFSET the next page continues after the
+        values of the ordering fields of the last row, so every page costs the same
+        and no COUNT(*) is needed. Cursors are signed, so they are opaque for clients.
+        The last ordering field has to be unique (e.g. id)."""
+    salt = 'beer_haven.keyset'
+
+    def __init__(self, queryset, per_page, ordering=('-published', 'id'), count_strategy=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.count_strategy = count_strategy
+
+    @cached_property
+    def count(self):
+        """ approximate number of rows or None if no count strategy is set """
+        if self.count_strategy is None:
+            return None
+        return COUNT_STRATEGIES[self.count_strategy](self.queryset)
+
+    @staticmethod
+    def _field(order):
+        return order.lstrip('-')
+
+    @property
+    def _salt(self):
+        # a cursor is only valid for the ordering it was created with
+        return f'{self.salt}:{",".join(self.ordering)}'
+
+    def _encode(self, obj, direction):
+        values = [getattr(obj, self._field(order)) for order in self.ordering]
+        return signing.dumps([direction, [str(value) for value in values]], salt=self._salt, compress=True)
+
+    def _decode(self, cursor):
+        """ returns (direction, values) or None for missing / tampered cursor """
+        if not cursor:
+            return None
+        try:
+            direction, values = signing.loads(cursor, salt=self._salt)
+        except (signing.BadSignature, ValueError, TypeError):
+            return None
+        if direction not in ('next', 'prev') or len(values) != len(self.ordering):
+            return None
+        model = self.queryset.model
+        values = [model._meta.get_field(self._field(order)).to_python(value)
+                  for order, value in zip(self.ordering, values)]
+        return direction, values
+
+    def _seek(self, values, forward):
+        """ Rows placed after `values` in the ordering (or before when not forward).
+            The first field gets an additional range condition so the index can seek to it."""
+        condition = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            field = self._field(order)
+            descending = order.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first_field = self._field(self.ordering[0])
+        range_lookup = 'lte' if self.ordering[0].startswith('-') == forward else 'gte'
+        return Q(**{f'{first_field}__{range_lookup}': values[0]}) & condition
+
+    @staticmethod
+    def _reversed(order):
+        return order[1:] if order.startswith('-') else f'-{order}'
+
+    def page(self, cursor=None):
+        decoded = self._decode(cursor)
+        queryset = self.queryset
+        if decoded is None:
+            direction = 'next'
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+        else:
+            direction, values = decoded
+            forward = direction == 'next'
+            ordering = self.ordering if forward else [self._reversed(order) for order in self.ordering]
+            rows = list(queryset.filter(self._seek(values, forward)).order_by(*ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, True
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            has_more, has_before = has_before, has_more
+
+        next_cursor = self._encode(rows[-1], 'next') if rows and has_more else None
+        previous_cursor = self._encode(rows[0], 'prev') if rows and has_before else None
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
@@ -0,0 +1,127 @@
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone as dt_timezone
+from time import sleep
+
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from stripe.error import StripeError
+
+# https://stripe.com/docs/api/checkout/sessions/object
+CheckoutSession = namedtuple('CheckoutSession', ['id', 'url', 'expires'])
+
+# sessions are created without expires_at, so a retried request sends exactly the same parameters
+# and Stripe uses its default lifetime
+SESSION_LIFETIME = timedelta(hours=24)
+# a session about to expire is not handed out again, the customer needs time to pay
+REUSE_MARGIN = timedelta(minutes=5)
+
+
+class PaymentGatewayError(Exception):
+    """Raised when the payment gateway could not create a checkout session."""
+
+
+class StripeGateway:
+    """ Creates Stripe checkout sessions. Network errors are retried by the Stripe library
+        (max_retries times, with the same idempotency key), every request gives up after timeout seconds."""
+
+    def __init__(self, timeout=10, max_retries=2):
+        # the Stripe library is configured globally, get_gateway() creates the gateway once per process
+        # https://github.com/stripe/stripe-python#configuring-automatic-retries
+        stripe.max_network_retries = max_retries
+        stripe.default_http_client = stripe.http_client.new_default_http_client(timeout=timeout)
+
+    def create_session(self, data, idempotency_key):
+        try:
+            session = stripe.checkout.Session.create(
+                api_key=settings.STRIPE_SECRET_KEY,
+                stripe_version=settings.STRIPE_API_VERSION,
+                idempotency_key=idempotency_key,
+                **data
+            )
+        except StripeError as error:
+            raise PaymentGatewayError(str(error)) from error
+        return CheckoutSession(session.id, session.url, datetime.fromtimestamp(session.expires_at, dt_timezone.utc))
+
+
+class StubGateway:
+    """ Offline stand-in for load tests and development. Sessions are kept in memory and, like in Stripe,
+        the same idempotency key returns the same session. latency (seconds) imitates the network."""
+
+    def __init__(self, latency=0, url='/payment-completed/'):
+        self.latency = latency
+        self.url = url
+        self.sessions = {}
+
+    def create_session(self, data, idempotency_key):
+        sleep(self.latency)
+        if idempotency_key not in self.sessions:
+            session_id = 'cs_stub_' + hashlib.sha256(idempotency_key.encode()).hexdigest()[:24]
+            self.sessions[idempotency_key] = CheckoutSession(
+                session_id, f'{self.url}?session_id={session_id}', timezone.now() + SESSION_LIFETIME
+            )
+        return self.sessions[idempotency_key]
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    """ Gateway class and its options come from settings.PAYMENT_GATEWAY and PAYMENT_GATEWAY_OPTIONS.
+        It is created once per process and shared by all requests."""
+    return import_string(settings.PAYMENT_GATEWAY)(**settings.PAYMENT_GATEWAY_OPTIONS)
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    """ settings overridden in tests get a new gateway """
+    if setting in ('PAYMENT_GATEWAY', 'PAYMENT_GATEWAY_OPTIONS'):
+        get_gateway.cache_clear()
+
+
+def build_line_items(order):
+    """ Line items of the order built with one query. Amounts are fractional (e.g. 0.3 kg), so every line
+        is sent as one unit priced at the line cost - the sum charged by Stripe equals order.total."""
+    items = order.items.select_related('ingredient')
+    return [
+        {
+            'price_data': {
+                'unit_amount': int(item.get_cost() * 100),
+                'currency': 'pln',
+                'product_data': {
+                    'name': f'{item.ingredient.name} x {item.amount:g}',
+                },
+            },
+            'quantity': 1,
+        }
+        for item in items
+    ]
+
+
+def get_checkout_url(order, success_url, cancel_url, gateway=None):
+    """ Returns the url of the order's checkout session.
+        An open session stored on the order is reused without calling the gateway. Otherwise a new one
+        is created with the idempotency key 'order-<id>-checkout-<attempt>': a retried or double clicked
+        POST sends the same key and gets the same session, a new key is used only once the previous
+        session expired."""
+    now = timezone.now()
+    if order.payment_session_id and order.payment_expires and order.payment_expires > now + REUSE_MARGIN:
+        return order.payment_url
+
+    gateway = gateway or get_gateway()
+    attempt = order.payment_attempts + 1
+    session = gateway.create_session({
+        'mode': 'payment',
+        'client_reference_id': str(order.id),
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'line_items': build_line_items(order),
+    }, idempotency_key=f'order-{order.id}-checkout-{attempt}')
+
+    order.payment_session_id, order.payment_url, order.payment_expires = session
+    order.payment_attempts = attempt
+    order.save(update_fields=['payment_session_id', 'payment_url', 'payment_expires', 'payment_attempts'])
+    return session.url
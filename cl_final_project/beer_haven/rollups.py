@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Ceil, Coalesce, Round
+
+from .models import Recipe, RecipeIngredient, float_as_decimal
+
+
+def cart_quantity():
+    """ Database version of RecipeIngredient.cart_amount(): kilograms or whole pieces """
+    amount = float_as_decimal('amount')
+    return Case(
+        When(unit=0, then=Round(amount / 1000, 3)),
+        # rounded first like cart_amount(), float noise (e.g. 3.0000000000000004) does not add a piece
+        When(unit=2, then=Ceil(Round(amount, 6))),
+        default=Round(amount, 3),
+        output_field=DecimalField(),
+    )
+
+
+def recipe_rollups():
+    """ Expressions of the denormalized Recipe columns: cost of all ingredients (for the recipe batch volume,
+        lines rounded to cents like in the cart), number of distinct ingredients and of those not in stock."""
+    lines = RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+    cost = lines.annotate(value=Sum(Round(F('ingredient__price') * cart_quantity(), 2))).values('value')
+    count = lines.annotate(value=Count('ingredient', distinct=True)).values('value')
+    missing = lines.annotate(value=Count('ingredient', distinct=True, filter=Q(ingredient__in_stock=False))).values('value')
+    return {
+        'ingredients_cost': Coalesce(Subquery(cost), Value(Decimal('0.00')), output_field=DecimalField()),
+        'ingredients_count': Coalesce(Subquery(count), 0),
+        'missing_ingredients': Coalesce(Subquery(missing), 0),
+    }
+
+
+def update_recipe_rollups(recipe_ids):
+    """ Recomputes rollups of given recipes with a single UPDATE query. recipe_ids may be a list
+        or a queryset of ids (then it is used as a subquery and never loaded into Python)."""
+    if isinstance(recipe_ids, (list, tuple, set)) and not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(**recipe_rollups())
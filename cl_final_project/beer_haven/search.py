@@ -0,0 +1,145 @@
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value, CharField, BooleanField, Case, When
+from django.db.models.functions import Coalesce
+
+from .models import Recipe, RecipeIngredient, Ingredient, Category, Dictionary
+
+# https://docs.djangoproject.com/en/4.2/ref/contrib/postgres/search/
+SEARCH_CONFIG = 'english'
+
+
+def _names_subquery(queryset, name_field):
+    """ correlated subquery returning all related names of one recipe as a single string """
+    names = queryset.filter(recipe=OuterRef('pk')).values('recipe').annotate(
+        names=StringAgg(name_field, delimiter=' ')
+    ).values('names')
+    return Coalesce(Subquery(names), Value(''), output_field=TextField())
+
+
+def recipe_search_vector():
+    """ Weighted search vector of a recipe:
+        A - title, B - categories and ingredients names, C - descriptions """
+    categories = _names_subquery(Recipe.categories.through.objects, 'category__name')
+    ingredients = _names_subquery(RecipeIngredient.objects, 'ingredient__name')
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(categories, ingredients, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', 'prep_description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(recipe_ids):
+    """ recomputes stored search vector for given recipes with a single UPDATE query """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=recipe_search_vector())
+
+
+def build_search_query(query):
+    """ Turns user input into a prefix tsquery, so 'pale al' matches 'Pale Ale'.
+        Only word characters are passed on, which keeps the raw tsquery syntax safe."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    raw_query = ' & '.join(f'{term}:*' for term in terms)
+    return SearchQuery(raw_query, search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_recipes(query):
+    """ returns recipes matching query ordered by rank, using only the indexed search_vector column """
+    search_query = build_search_query(query)
+    if search_query is None:
+        return Recipe.objects.none()
+    return Recipe.objects.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-published', 'id')
+
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MIN_LENGTH = 2
+
+
+class PrefixCache:
+    """ Small in-process LRU cache of autocomplete answers for hot prefixes.
+        Entries expire after `ttl` seconds, so other processes pick up changes
+        even though clear() is only called in the process which saved the data."""
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+autocomplete_cache = PrefixCache()
+
+# (kind, queryset, searched field)
+AUTOCOMPLETE_SOURCES = (
+    ('recipe', Recipe.objects.filter(status='PD'), 'title'),
+    ('ingredient', Ingredient.objects.all(), 'name'),
+    ('category', Category.objects.all(), 'name'),
+    ('dictionary', Dictionary.objects.all(), 'title'),
+)
+
+
+def _autocomplete_queryset(kind, queryset, field, query, limit):
+    """ Typo tolerant prefix match served by the gin_trgm_ops index of `field`.
+        Exact prefixes go first, then the most similar names."""
+    return queryset.filter(
+        Q(**{f'{field}__trigram_word_similar': query}) | Q(**{f'{field}__trigram_similar': query})
+    ).annotate(
+        kind=Value(kind, output_field=CharField()),
+        label=F(field),
+        is_prefix=Case(
+            When(**{f'{field}__istartswith': query}, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+        similarity=TrigramWordSimilarity(query, field),
+    ).order_by('-is_prefix', '-similarity', field).values('kind', 'pk', 'label', 'is_prefix', 'similarity')[:limit]
+
+
+def autocomplete(query, limit=AUTOCOMPLETE_LIMIT):
+    """ Returns at most `limit` suggestions for recipes, ingredients, categories
+        and dictionary entries, fetched with a single UNION query and cached per prefix. """
+    query = ' '.join(query.split()).lower()[:64]
+    if len(query) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+    key = (query, limit)
+    suggestions = autocomplete_cache.get(key)
+    if suggestions is None:
+        querysets = [_autocomplete_queryset(kind, queryset, field, query, limit)
+                     for kind, queryset, field in AUTOCOMPLETE_SOURCES]
+        union = querysets[0].union(*querysets[1:], all=True).order_by('-is_prefix', '-similarity', 'label')[:limit]
+        suggestions = [{'kind': row['kind'], 'pk': row['pk'], 'label': row['label']} for row in union]
+        autocomplete_cache.set(key, suggestions)
+    return suggestions
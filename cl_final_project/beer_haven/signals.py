@@ -0,0 +1,191 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Recipe, RecipeIngredient, Ingredient, Category, Dictionary, GuestOrderItem, UserOrderItem, Profile, RecipeVote, CustomerOrderItem
+from .search import update_search_vector, autocomplete_cache
+from .caching import invalidate_recipes, invalidate_recent_recipes, invalidate_dictionary
+from .rollups import update_recipe_rollups
+from .thumbnails import image_field, queue_thumbnails
+from .votes import remove_vote_from_counter
+
+# https://docs.djangoproject.com/en/4.2/topics/signals/
+
+
+def recipes_changed(recipe_ids):
+    """ recomputes stored search vectors and drops cached fragments of given recipes """
+    recipe_ids = list(recipe_ids)
+    update_search_vector(recipe_ids)
+    invalidate_recipes(recipe_ids)
+
+
+@receiver(post_init, sender=Recipe)
+def recipe_loaded(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, raw=False, **kwargs):
+    """ keeps the stored search vector and cached fragments in sync with recipe fields """
+    if not raw:
+        recipes_changed([instance.pk])
+        # published, unpublished or a published one changed - the landing page shows published recipes only
+        if 'PD' in (instance.status, instance._loaded_status):
+            invalidate_recent_recipes()
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+    if instance.status == 'PD':
+        invalidate_recent_recipes()
+
+
+@receiver(m2m_changed, sender=Recipe.categories.through)
+def recipe_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # category.recipe_cat.clear() does not pass recipe ids, they are remembered before clearing
+        instance._cleared_recipe_ids = list(instance.recipe_cat.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            recipes_changed([instance.pk])
+        elif action == 'post_clear':
+            recipes_changed(getattr(instance, '_cleared_recipe_ids', []))
+        else:
+            recipes_changed(pk_set)
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_recipe_updates():
+    """ Recipe ingredient changes made inside the block (and recipe ids added to the yielded set)
+        update search vectors, cached fragments and rollups once at the end instead of once per row."""
+    if getattr(_batch, 'recipe_ids', None) is not None:
+        # nested block, the outer one updates
+        yield _batch.recipe_ids
+        return
+    _batch.recipe_ids = recipe_ids = set()
+    try:
+        yield recipe_ids
+    finally:
+        _batch.recipe_ids = None
+    recipe_ids.discard(None)
+    if recipe_ids:
+        recipes_changed(recipe_ids)
+        update_recipe_rollups(list(recipe_ids))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if getattr(_batch, 'recipe_ids', None) is not None:
+        _batch.recipe_ids.add(instance.recipe_id)
+    else:
+        recipes_changed([instance.recipe_id])
+        update_recipe_rollups([instance.recipe_id])
+
+
+@receiver(post_init, sender=Ingredient)
+def ingredient_loaded(sender, instance, **kwargs):
+    # __dict__ is used so deferred fields are not fetched just for this
+    instance._loaded_values = {field: instance.__dict__.get(field) for field in ('name', 'price', 'in_stock')}
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, raw=False, **kwargs):
+    """ ingredient name is a part of every recipe which uses it, price and stock are in recipe rollups """
+    if not created and not raw:
+        loaded = instance._loaded_values
+        recipe_ids = instance.ingredient_recipes.values('recipe_id')
+        if instance.name != loaded['name']:
+            recipes_changed(recipe_ids.values_list('recipe_id', flat=True).distinct())
+        if instance.price != loaded['price'] or instance.in_stock != loaded['in_stock']:
+            update_recipe_rollups(recipe_ids)
+    ingredient_loaded(sender, instance)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        recipes_changed(instance.recipe_cat.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_pre_delete(sender, instance, **kwargs):
+    """ category relations are removed without m2m signals, so recipe ids have to be remembered before delete """
+    instance._recipe_ids = list(instance.recipe_cat.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    recipes_changed(getattr(instance, '_recipe_ids', []))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Dictionary)
+@receiver(post_delete, sender=Dictionary)
+def clear_autocomplete_cache(sender, **kwargs):
+    """ suggestions are cached per process, a change of any suggested name drops them all """
+    autocomplete_cache.clear()
+
+
+@receiver(post_save, sender=Dictionary)
+@receiver(post_delete, sender=Dictionary)
+def dictionary_changed(sender, **kwargs):
+    invalidate_dictionary()
+
+
+@receiver(post_delete, sender=RecipeVote)
+def recipe_vote_deleted(sender, instance, origin=None, **kwargs):
+    """ Every deleted vote (withdrawn or deleted with its user) decreases the count. Votes deleted
+        with their recipe are skipped, the counters are deleted with it."""
+    if isinstance(origin, Recipe) or getattr(origin, 'model', None) is Recipe:
+        return
+    remove_vote_from_counter(instance.recipe_id)
+
+
+@receiver(post_save, sender=GuestOrderItem)
+@receiver(post_delete, sender=GuestOrderItem)
+@receiver(post_save, sender=UserOrderItem)
+@receiver(post_delete, sender=UserOrderItem)
+@receiver(post_save, sender=CustomerOrderItem)
+@receiver(post_delete, sender=CustomerOrderItem)
+def order_item_changed(sender, instance, raw=False, **kwargs):
+    """ keeps the order total in sync for items written one by one (e.g. in the admin inline) """
+    if not raw:
+        sender.objects.update_order_totals([instance.order_id])
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=Ingredient)
+@receiver(post_init, sender=Profile)
+def image_loaded(sender, instance, **kwargs):
+    value = instance.__dict__.get(image_field(instance))
+    instance._loaded_image = getattr(value, 'name', value)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Profile)
+def image_saved(sender, instance, raw=False, **kwargs):
+    """ a new or replaced image gets its thumbnails from the process_thumbnails worker """
+    field = image_field(instance)
+    # a deferred image was not changed
+    if raw or field not in instance.__dict__:
+        return
+    name = getattr(instance, field).name
+    if name and name != instance._loaded_image:
+        queue_thumbnails(instance)
+    instance._loaded_image = name
@@ -0,0 +1,36 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from beer_haven.thumbnails import current_thumbnails, image_field
+
+# https://docs.djangoproject.com/en/4.2/howto/custom-template-tags/
+register = template.Library()
+
+
+@register.filter
+def srcset(instance, extension='jpeg'):
+    """ srcset attribute value of the instance's thumbnails, e.g. {{ recipe|srcset:'webp' }} """
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w' for width, name in current_thumbnails(instance).get(extension, [])
+    )
+
+
+@register.inclusion_tag('beer_haven/responsive-image.html')
+def responsive_image(instance, sizes='100vw', width=None, alt=''):
+    """ <picture> with WebP and JPEG thumbnails. The fallback src is the smallest thumbnail at least
+        width pixels wide, the original is used until thumbnails are generated."""
+    thumbnails = current_thumbnails(instance)
+    jpeg = thumbnails.get('jpeg', [])
+    if jpeg:
+        name = next((name for thumbnail_width, name in jpeg if width is None or thumbnail_width >= width), jpeg[-1][1])
+        src = default_storage.url(name)
+    else:
+        src = getattr(instance, image_field(instance)).url
+    return {
+        'src': src,
+        'webp': srcset(instance, 'webp'),
+        'jpeg': srcset(instance, 'jpeg'),
+        'sizes': sizes,
+        'width': width,
+        'alt': alt,
+    }
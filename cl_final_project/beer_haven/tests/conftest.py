@@ -3,6 +3,7 @@ import sys
 import pytest
 from django.test import Client
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from .utils import create_fake_users, fake_tips, create_fake_ingredient, create_fake_recipe, dictionary_fake_posts
 from beer_haven.models import Recipe, Ingredient, RecipeIngredient, Category
 
@@ -13,6 +14,12 @@ sys.path.append(os.path.dirname(__file__))
 User = get_user_model()
 fake = Faker()
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """cached fragments must not leak between tests"""
+    cache.clear()
+
+
 @pytest.fixture
 def client():
     client = Client()
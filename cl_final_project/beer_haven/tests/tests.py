@@ -1,13 +1,46 @@
+import hashlib
+import hmac
+import json
+import time
 import pytest
 
 from random import sample, randint, choice
+from decimal import Decimal
+from io import BytesIO, StringIO
+from PIL import Image
+from smtplib import SMTPException
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
 from django.urls import reverse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.apps import apps
+from django.template import Context, Template
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import HttpResponseForbidden
 from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
 from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
 from beer_haven.cart import Cart
+from beer_haven.search import AUTOCOMPLETE_LIMIT
+from beer_haven.outbox import queue_email, drain_outbox
+from beer_haven.payments import StubGateway
+from beer_haven.votes import cast_vote, current_votes, flush_vote_counts
+from beer_haven.thumbnails import current_thumbnails
+from beer_haven.order_copy import copy_orders
+from beer_haven.order_layout import create_customer_order
+from beer_haven.orders import create_order_from_cart
+from beer_haven.pagination import COUNT_STRATEGIES
+from beer_haven.admin import UserOrderAdmin
+from beer_haven.forms import GuestOrderCreateForm
+from beer_haven.management.commands.benchmark_payment_events import SECRET, completed_event, signed_headers
 
-from beer_haven.models import Recipe, Ingredient, ExperienceTip, Dictionary, Profile
+from beer_haven.models import Recipe, Ingredient, ExperienceTip, Dictionary, Profile, UserAddress, RecipeIngredient, Category, GuestOrder, GuestOrderItem, OutboxEmail, Order, UserOrder, PaymentEvent, RecipeVote, ThumbnailTask, CustomerOrder, CustomerOrderItem
 from utils import fake_tips, create_fake_recipe, create_fake_ingredient, dictionary_fake_posts
 
 User = get_user_model()
@@ -201,3 +234,925 @@ def test_guest_order(client, recipe_set_up):
 
 
 
+@pytest.mark.django_db
+def test_search_recipes(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    recipe.title = 'Smoked Porter'
+    recipe.save()
+
+    response = client.get(reverse('search'), {'query': 'smok port'})
+    assert response.status_code == 200
+    assert recipe in response.context['results']
+
+    response = client.post(reverse('search'), {'query': 'porter'})
+    assert response.status_code == 200
+    assert list(response.context['results'])[0] == recipe
+
+
+@pytest.mark.django_db
+def test_search_vector_follows_ingredient_name(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    ingredient = recipe.ingredients.first()
+    ingredient.name = 'Citra hops'
+    ingredient.save()
+
+    response = client.get(reverse('search'), {'query': 'citra'})
+    assert recipe in response.context['results']
+
+
+@pytest.mark.django_db
+def test_autocomplete(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    recipe.title = 'Hazy Pale Ale'
+    recipe.save()
+
+    response = client.get(reverse('search_autocomplete'), {'q': 'pale'})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) <= AUTOCOMPLETE_LIMIT
+    assert {'kind': 'recipe', 'pk': recipe.pk, 'label': 'Hazy Pale Ale',
+            'url': reverse('recipe-details', kwargs={'pk': recipe.pk})} in results
+
+    response = client.get(reverse('search_autocomplete'), {'q': 'p'})
+    assert response.json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_autocomplete_cache(client, recipe_set_up, django_assert_num_queries):
+    client.get(reverse('search_autocomplete'), {'q': 'hazy'})
+    with django_assert_num_queries(0):
+        client.get(reverse('search_autocomplete'), {'q': 'Hazy '})
+
+    recipe = choice(Recipe.objects.all())
+    recipe.title = 'Hazy IPA'
+    recipe.save()
+    response = client.get(reverse('search_autocomplete'), {'q': 'hazy'})
+    assert 'Hazy IPA' in [result['label'] for result in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_recipe_list_keyset(client, recipe_set_up, settings):
+    settings.RECIPES_PAGINATION = 'keyset'
+    settings.RECIPES_COUNT_STRATEGY = 'estimate'
+    for _ in range(20):
+        create_fake_recipe()
+    # equal publish dates make the id tie-breaker matter
+    Recipe.objects.filter(pk__in=Recipe.objects.values('pk')[:8]).update(published=Recipe.objects.first().published)
+    expected = list(Recipe.objects.filter(status='PD').order_by('-published', 'id'))
+
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(reverse('recipes'), {'cursor': cursor} if cursor else {})
+        assert response.status_code == 200
+        page = response.context['page_obj']
+        pages.append(list(page))
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert [recipe for page in pages for recipe in page] == expected
+    assert all(len(page) <= 10 for page in pages)
+
+    response = client.get(reverse('recipes'), {'cursor': page.previous_cursor})
+    assert list(response.context['page_obj']) == pages[-2]
+
+    response = client.get(reverse('recipes'), {'cursor': 'tampered'})
+    assert list(response.context['page_obj']) == pages[0]
+
+
+@pytest.mark.django_db
+def test_recipe_details_query_budget(client, recipe_set_up, django_assert_num_queries):
+    for _ in range(30):
+        create_fake_ingredient()
+    recipe = choice(Recipe.objects.all())
+    for ingredient in Ingredient.objects.exclude(ingredient_recipes__recipe=recipe):
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, amount=1)
+    recipe.categories.set(Category.objects.all())
+    for _ in range(5):
+        ExperienceTip.objects.create(recipe=recipe, content='tip')
+
+    # recipe, categories, ingredients
+    with django_assert_num_queries(3):
+        response = client.get(reverse('recipe-details', kwargs={'pk': recipe.pk}))
+    assert response.status_code == 200
+    assert len(response.context['recipe'].recipe_ingredients.all()) == recipe.recipe_ingredients.count()
+
+    # recipe body is cached
+    with django_assert_num_queries(1):
+        client.get(reverse('recipe-details', kwargs={'pk': recipe.pk}))
+
+    staff = User.objects.create_user(username='staff', password='test', is_staff=True)
+    client.force_login(staff)
+    # session, user, recipe, tips
+    with django_assert_num_queries(4):
+        response = client.get(reverse('recipe-details', kwargs={'pk': recipe.pk}))
+    assert len(response.context['experience_tips']) == recipe.tips.count()
+
+
+@pytest.mark.django_db
+def test_recipe_body_cache_invalidation(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    ingredient = recipe.ingredients.first()
+    url = reverse('recipe-details', kwargs={'pk': recipe.pk})
+    client.get(url)
+
+    ingredient.name = 'Golden Promise malt'
+    ingredient.save()
+    assert 'Golden Promise malt' in client.get(url).content.decode()
+
+    category = Category.objects.create(name='Smoked beers', slug='smoked-beers')
+    recipe.categories.add(category)
+    assert category.name in client.get(url).content.decode()
+
+    tip = ExperienceTip.objects.create(recipe=recipe, content='Mash at 67 degrees')
+    staff = User.objects.create_user(username='staff', password='test', is_staff=True)
+    client.force_login(staff)
+    assert tip.content in client.get(url).content.decode()
+
+
+GUEST_ORDER_DATA = {
+    'guest_first_name': 'name',
+    'guest_last_name': 'surname',
+    'guest_email': 'name@example.com',
+    'guest_billing_address': 'address1',
+    'guest_shipping_address': 'address2',
+    'guest_postal_code': '33-333'
+}
+
+
+@pytest.mark.django_db
+def test_guest_order_items_bulk(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    client.post(reverse('cart_add_recipe', kwargs={'recipe_id': recipe.id}))
+
+    response = client.post(reverse('guest_order_create'), GUEST_ORDER_DATA)
+    assert response.status_code == 302
+    order = GuestOrder.objects.get(id=client.session['order_id'])
+    items = order.items.all()
+    assert sorted(item.ingredient_id for item in items) == sorted(recipe.ingredients.values_list('id', flat=True))
+    assert all(item.price == Decimal('19.84') for item in items)
+
+
+@pytest.mark.django_db
+def test_guest_order_out_of_stock(client, recipe_set_up):
+    recipe = choice(Recipe.objects.all())
+    client.post(reverse('cart_add_recipe', kwargs={'recipe_id': recipe.id}))
+    recipe.ingredients.filter(pk=recipe.ingredients.first().pk).update(in_stock=False)
+    orders_before = GuestOrder.objects.count()
+
+    response = client.post(reverse('guest_order_create'), GUEST_ORDER_DATA)
+    assert response.status_code == 200
+    assert 'not in stock' in response.context['form'].non_field_errors()[0]
+    assert GuestOrder.objects.count() == orders_before
+    assert GuestOrderItem.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_order_email_outbox(client, recipe_set_up, mailoutbox):
+    recipe = choice(Recipe.objects.all())
+    client.post(reverse('cart_add_recipe', kwargs={'recipe_id': recipe.id}))
+    client.post(reverse('guest_order_create'), GUEST_ORDER_DATA)
+    # checkout only queues the message
+    assert len(mailoutbox) == 0
+    assert OutboxEmail.objects.filter(status='PG').count() == 1
+
+    call_command('send_outbox_emails', '--batch-size', '10')
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].to == [GUEST_ORDER_DATA['guest_email']]
+    assert f"Order (id: {client.session['order_id']})" in mailoutbox[0].body
+    assert OutboxEmail.objects.get().status == 'ST'
+
+
+@pytest.mark.django_db
+def test_outbox_retry(mailoutbox, monkeypatch):
+    email = queue_email('subject', 'body', 'shop@example.com', ['guest@example.com'])
+
+    def fail(message):
+        raise SMTPException('server busy')
+    monkeypatch.setattr('beer_haven.outbox.EmailMessage.send', fail)
+    assert drain_outbox() == 1
+    email.refresh_from_db()
+    assert (email.status, email.attempts) == ('PG', 1)
+    assert email.next_attempt_at > timezone.now()
+    assert 'server busy' in email.last_error
+
+    monkeypatch.undo()
+    OutboxEmail.objects.update(next_attempt_at=timezone.now())
+    assert drain_outbox() == 1
+    email.refresh_from_db()
+    assert (email.status, email.attempts) == ('ST', 2)
+    assert len(mailoutbox) == 1
+
+
+@pytest.mark.django_db
+def test_order_total_matches_python(recipe_set_up, django_assert_num_queries):
+    order = GuestOrder.objects.create(
+        guest_first_name='name', guest_last_name='surname', guest_email='name@example.com',
+        guest_shipping_address='address', guest_postal_code='33-333'
+    )
+    ingredients = list(Ingredient.objects.all())
+    amounts = [42, 0.5, 0.1 + 0.2, 0.7 - 0.4, 1.005, 2.675, 1 / 3, 1e-05, 333.333]
+    prices = ['19.84', '0.05', '0.05', '0.05', '1.00', '9.99', '3.33', '1234.56', '0.01']
+    # OrderItem rows, child rows and the order total
+    with django_assert_num_queries(3):
+        items = GuestOrderItem.objects.bulk_create_items([
+            GuestOrderItem(order=order, ingredient=choice(ingredients), price=Decimal(price), amount=amount)
+            for amount, price in zip(amounts, prices)
+        ])
+    assert sorted(order.items.values_list('id', flat=True)) == sorted(item.id for item in items)
+    # one more item written the ordinary way
+    GuestOrderItem.objects.create(order=order, ingredient=choice(ingredients), price=Decimal('7.77'), amount=0.125)
+
+    python_total = sum(item.get_cost() for item in order.items.all())
+    with django_assert_num_queries(1):
+        assert order.get_total_cost() == python_total
+    order.refresh_from_db()
+    assert order.total == python_total
+
+    order.items.first().delete()
+    order.refresh_from_db()
+    assert order.total == sum(item.get_cost() for item in order.items.all())
+
+
+@pytest.mark.django_db
+def test_cart_hydration(client, recipe_set_up, django_assert_num_queries):
+    ingredients = list(Ingredient.objects.all()[:5])
+    for ingredient in ingredients:
+        client.post(reverse('cart_add', kwargs={'ingredient_id': ingredient.id}), {'amount': 0.1})
+    client.post(reverse('cart_add', kwargs={'ingredient_id': ingredients[0].id}), {'amount': 0.2})
+    stored = client.session['cart']
+    assert stored['ids'] == [ingredient.id for ingredient in ingredients]
+    assert stored['prices'] == ['19.84'] * 5
+
+    request = RequestFactory().get('/')
+    request.session = client.session
+    cart = Cart(request)
+    # one Ingredient query, no matter how many times the cart is iterated
+    with django_assert_num_queries(1):
+        for _ in range(3):
+            items = list(cart)
+        assert cart.get_total_price() == sum(item['total_price'] for item in items)
+    assert [item['ingredient'] for item in items] == ingredients
+    assert items[0]['amount'] == Decimal('0.30000000000000004')
+    assert not request.session.modified
+
+    # session, cart ingredients
+    with django_assert_num_queries(2):
+        response = client.get(reverse('cart_details'))
+    assert 'update_amount_form' in list(response.context['cart'])[0]
+
+
+@pytest.mark.django_db
+def test_cached_session_query_budget(client, recipe_set_up, settings, django_assert_num_queries):
+    # SESSION_MODE 'cached_db', as with a 'sessions' cache in local_settings.py: the session is read from
+    # the cache, the budgets above drop by one query
+    settings.CACHES = {**settings.CACHES, 'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                       'LOCATION': 'sessions'}}
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    settings.SESSION_CACHE_ALIAS = 'sessions'
+    ingredient = Ingredient.objects.first()
+    client.post(reverse('cart_add', kwargs={'ingredient_id': ingredient.id}), {'amount': 0.1})
+    # cart ingredients only
+    with django_assert_num_queries(1):
+        client.get(reverse('cart_details'))
+
+    recipe = choice(Recipe.objects.all())
+    client.get(reverse('recipe-details', kwargs={'pk': recipe.pk}))
+    client.force_login(User.objects.create_user(username='staff', password='test', is_staff=True))
+    # user, recipe, tips
+    with django_assert_num_queries(3):
+        client.get(reverse('recipe-details', kwargs={'pk': recipe.pk}))
+
+
+@pytest.mark.django_db
+def test_cart_legacy_session_format(client, recipe_set_up):
+    ingredient = Ingredient.objects.first()
+    session = client.session
+    session['cart'] = {str(ingredient.id): {'amount': 2, 'price': '10.00'}}
+    session.save()
+
+    response = client.get(reverse('cart_details'))
+    item = list(response.context['cart'])[0]
+    assert (item['ingredient'], item['amount'], item['total_price']) == (ingredient, Decimal(2), Decimal('20.00'))
+
+
+@pytest.mark.django_db
+def test_cart_limits(client, recipe_set_up, settings):
+    settings.CART_MAX_ITEMS = 2
+    settings.CART_MAX_AMOUNT = 5
+    first, second, third = Ingredient.objects.all()[:3]
+    for ingredient in (first, second, third):
+        client.post(reverse('cart_add', kwargs={'ingredient_id': ingredient.id}), {'amount': 3})
+    response = client.post(reverse('cart_add', kwargs={'ingredient_id': first.id}), {'amount': 3}, follow=True)
+
+    assert client.session['cart'] == {'ids': [first.id, second.id], 'amounts': [3.0, 3.0], 'prices': ['19.84'] * 2}
+    assert [str(message) for message in response.context['messages']] == [
+        'The cart can hold up to 2 different ingredients.',
+        f'The amount of {first.name} cannot exceed 5.',
+    ]
+
+
+@pytest.mark.django_db
+def test_purge_sessions(settings):
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    now = timezone.now()
+    Session.objects.bulk_create(
+        [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(5)]
+        + [Session(session_key='active', session_data='', expire_date=now + timedelta(days=1))]
+    )
+    out = StringIO()
+    call_command('purge_sessions', batch_size=2, pause=0, stdout=out)
+
+    assert out.getvalue() == 'Deleted 5 expired sessions.\n'
+    assert list(Session.objects.values_list('session_key', flat=True)) == ['active']
+
+
+@pytest.mark.django_db
+def test_cart_add_recipe(client, recipe_set_up, django_assert_num_queries):
+    malt, hops, yeast = Ingredient.objects.all()[:3]
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='',
+                                   status='PD', batch_volume=20)
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe=recipe, ingredient=malt, amount=4.5, unit=1),
+        RecipeIngredient(recipe=recipe, ingredient=hops, amount=30, unit=0),
+        RecipeIngredient(recipe=recipe, ingredient=hops, amount=20, unit=0),
+        RecipeIngredient(recipe=recipe, ingredient=yeast, amount=1, unit=2),
+    ])
+
+    # recipe ingredients, then the one session write: new key check, savepoint, insert, release
+    with django_assert_num_queries(5):
+        client.post(reverse('cart_add_recipe', kwargs={'recipe_id': recipe.id}), {'litres': 30})
+    assert client.session['cart']['ids'] == [malt.id, hops.id, yeast.id]
+    assert client.session['cart']['amounts'] == [6.75, 0.075, 2.0]
+
+    request = RequestFactory().get('/')
+    request.session = client.session
+    cart = Cart(request)
+    cart.remove_many([malt.id, yeast.id])
+    assert (cart.ids, cart.amounts) == ([hops.id], [0.075])
+    assert client.post(reverse('cart_add_recipe', kwargs={'recipe_id': 0})).status_code == 404
+
+
+@pytest.mark.django_db
+def test_payment_session_reused(client, recipe_set_up, settings, monkeypatch, django_assert_num_queries):
+    settings.PAYMENT_GATEWAY = 'beer_haven.payments.StubGateway'
+    settings.PAYMENT_GATEWAY_OPTIONS = {}
+    calls = []
+    create_session = StubGateway.create_session
+    monkeypatch.setattr(StubGateway, 'create_session', lambda self, data, idempotency_key: calls.append(
+        (data, idempotency_key)) or create_session(self, data, idempotency_key))
+
+    recipe = choice(Recipe.objects.all())
+    client.post(reverse('cart_add_recipe', kwargs={'recipe_id': recipe.id}), {'litres': 500})
+    client.post(reverse('guest_order_create'), GUEST_ORDER_DATA)
+    order = GuestOrder.objects.get(id=client.session['order_id'])
+
+    # session, order, line items with ingredient names, saving the session on the order
+    with django_assert_num_queries(4):
+        first = client.post(reverse('payment_process'))
+    second = client.post(reverse('payment_process'))
+    assert first.status_code == 303 and first.url == second.url
+    assert len(calls) == 1
+    data, key = calls[0]
+    assert key == f'order-{order.id}-checkout-1'
+    assert sum(line['price_data']['unit_amount'] * line['quantity'] for line in data['line_items']) == order.total * 100
+
+    # an expired session is replaced by a new one
+    GuestOrder.objects.filter(id=order.id).update(payment_expires=timezone.now())
+    third = client.post(reverse('payment_process'))
+    assert third.url != first.url
+    assert calls[1][1] == f'order-{order.id}-checkout-2'
+
+
+@pytest.mark.django_db
+def test_payment_webhook(client, random_user, settings):
+    guest_order = GuestOrder.objects.create(**GUEST_ORDER_DATA)
+    user_order = UserOrder.objects.create(user=random_user)
+    payloads = [json.dumps(completed_event(number, order.id)) for number, order in enumerate([guest_order, user_order])]
+
+    # without a secret every signature would be valid, nothing is accepted
+    settings.STRIPE_WEBHOOK_SECRET = ''
+    timestamp = int(time.time())
+    forged = hmac.new(b'', f'{timestamp}.{payloads[0]}'.encode(), hashlib.sha256).hexdigest()
+    assert client.post(reverse('payment_webhook'), payloads[0], content_type='application/json',
+                       HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={forged}').status_code == 503
+
+    settings.STRIPE_WEBHOOK_SECRET = SECRET
+    assert client.post(reverse('payment_webhook'), payloads[0], content_type='application/json',
+                       HTTP_STRIPE_SIGNATURE='t=1,v1=forged').status_code == 400
+    # a correctly signed but old event (a replay) is rejected
+    stale = signed_headers(payloads[0], timestamp=timestamp - 3600)
+    assert client.post(reverse('payment_webhook'), payloads[0], content_type='application/json', **stale).status_code == 400
+    assert not PaymentEvent.objects.exists()
+    # the second event is delivered twice
+    for payload in payloads + payloads[1:]:
+        response = client.post(reverse('payment_webhook'), payload, content_type='application/json',
+                               **signed_headers(payload))
+        assert response.status_code == 200
+    assert PaymentEvent.objects.count() == 2
+    assert not GuestOrder.objects.get(id=guest_order.id).paid
+
+    call_command('process_payment_events', stdout=StringIO())
+    assert GuestOrder.objects.get(id=guest_order.id).paid and UserOrder.objects.get(id=user_order.id).paid
+    assert not PaymentEvent.objects.filter(processed__isnull=True).exists()
+
+    Order.objects.update(paid=False)
+    out = StringIO()
+    call_command('replay_payment_events', event=['evt_benchmark_0'], stdout=out)
+    assert out.getvalue() == 'replayed 1 events, processed 1 events\n'
+    assert list(Order.objects.filter(paid=True).values_list('id', flat=True)) == [guest_order.id]
+
+
+@pytest.mark.django_db
+def test_check_query_plans(recipe_set_up):
+    out = StringIO()
+    call_command('check_query_plans', stdout=out)
+    assert 'SEQ SCAN' not in out.getvalue()
+    # test tables are tiny, the planner scans them sequentially - every such scan is reported with threshold -1
+    with pytest.raises(CommandError, match='ingredients by name: sequential scan of beer_haven_ingredient'):
+        call_command('check_query_plans', threshold=-1, stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_landing_page_cache(client, recipe_set_up, django_assert_num_queries, monkeypatch):
+    client.get(reverse('index'))
+    with django_assert_num_queries(0):
+        response = client.get(reverse('index'))
+    assert [recipe.id for recipe in response.context['recent_recipes']] == list(
+        Recipe.objects.filter(status='PD').values_list('id', flat=True)[:3])
+
+    # expired: while another worker holds the lock the stale copy is served, then one request refreshes it
+    monkeypatch.setattr('beer_haven.caching.RECENT_RECIPES_TTL', -1)
+    cache.clear()
+    client.get(reverse('index'))
+    cache.add('beer_haven:recent_recipes:lock', True)
+    with django_assert_num_queries(0):
+        client.get(reverse('index'))
+    cache.delete('beer_haven:recent_recipes:lock')
+    with django_assert_num_queries(1):
+        client.get(reverse('index'))
+
+    newest = Recipe.objects.create(title='Newest', slug='newest', description='', prep_description='', status='PD')
+    response = client.get(reverse('index'))
+    assert response.context['recent_recipes'][0].id == newest.id
+    newest.status = 'DT'
+    newest.save()
+    response = client.get(reverse('index'))
+    assert newest.id not in [recipe.id for recipe in response.context['recent_recipes']]
+
+
+@pytest.mark.django_db
+def test_recipe_rollups(client, recipe_set_up, settings):
+    malt, hops, yeast = Ingredient.objects.all()[:3]
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='', status='PD')
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=malt, amount=4.5, unit=1)
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=hops, amount=30, unit=0)
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=hops, amount=25, unit=0)
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=yeast, amount=0.5, unit=2)
+    recipe.refresh_from_db()
+    # 4.5 kg + 0.03 kg + 0.025 kg + 1 piece at 19.84
+    assert (recipe.ingredients_cost, recipe.ingredients_count, recipe.missing_ingredients) == (
+        Decimal('89.28') + Decimal('0.60') + Decimal('0.50') + Decimal('19.84'), 3, 0)
+
+    hops.in_stock = False
+    hops.price = Decimal('100.00')
+    hops.save()
+    recipe.refresh_from_db()
+    assert (recipe.ingredients_cost, recipe.missing_ingredients) == (Decimal('89.28') + Decimal('3.00') + Decimal('2.50') + Decimal('19.84'), 1)
+
+    RecipeIngredient.objects.filter(ingredient=hops).delete()
+    recipe.refresh_from_db()
+    assert (recipe.ingredients_cost, recipe.ingredients_count, recipe.missing_ingredients) == (Decimal('109.12'), 2, 0)
+
+    # float noise does not add a piece, as in the cart
+    line = RecipeIngredient.objects.get(recipe=recipe, ingredient=yeast)
+    line.amount = 3.0000000000000004
+    line.save()
+    recipe.refresh_from_db()
+    assert line.cart_amount() == 3
+    assert recipe.ingredients_cost == Decimal('89.28') + 3 * Decimal('19.84')
+
+    for pagination in ('offset', 'keyset'):
+        settings.RECIPES_PAGINATION = pagination
+        response = client.get(reverse('recipes'), {'sort': 'priciest'})
+        assert response.context['recipes'][0] == recipe
+        costs = [recipe.ingredients_cost for recipe in response.context['recipes']]
+        assert costs == sorted(costs, reverse=True)
+
+
+@pytest.mark.django_db
+def test_recipes_facets(client, monkeypatch, django_assert_num_queries):
+    stouts = Category.objects.create(name='Stouts', slug='stouts')
+    ales = Category.objects.create(name='Ales', slug='ales')
+    oats = Ingredient.objects.create(name='Oats', slug='oats', category=stouts, description='', in_stock=True, price=5)
+    for abv, votes, categories in [(3.5, 0, [ales]), (5, 12, [ales]), (5.5, 60, [ales, stouts]), (9, 150, [stouts])]:
+        recipe = Recipe.objects.create(title=f'{abv}%', slug='recipe', description='', prep_description='',
+                                       estimated_abv=abv, votes=votes, status='PD')
+        recipe.categories.set(categories)
+        if stouts in categories:
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=oats, amount=500)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=oats, amount=100)
+
+    # recipes count, page, facet counts
+    with django_assert_num_queries(3):
+        response = client.get(reverse('recipes'), {'category': 'ales', 'abv': ['4-6', '8+']})
+    assert [recipe.title for recipe in response.context['recipes']] == ['5.5%', '5%']
+    facets = {name: {value['key']: (value['count'], value['selected']) for value in values}
+              for name, values in response.context['facets'].items()}
+    # a facet is counted without its own selection
+    assert facets['category'] == {'ales': (2, True), 'stouts': (2, False)}
+    assert facets['abv'] == {'0-4': (1, False), '4-6': (2, True), '6-8': (0, False), '8+': (0, True)}
+    assert facets['ingredient'] == {str(oats.id): (1, False)}
+    assert facets['votes'] == {'10': (2, False), '50': (1, False), '100': (0, False)}
+
+    response = client.get(reverse('recipes'), {'ingredient': oats.id, 'votes': 100})
+    assert [recipe.title for recipe in response.context['recipes']] == ['9%']
+
+    # selected values outside the most used ones are still listed
+    monkeypatch.setattr('beer_haven.facets.CATEGORY_LIMIT', 1)
+    monkeypatch.setattr('beer_haven.facets.INGREDIENT_LIMIT', 0)
+    response = client.get(reverse('recipes'), {'category': ['stouts', 'lagers'], 'ingredient': oats.id, 'abv': '4-6'})
+    facets_shown = {name: {value['key']: (value['count'], value['selected']) for value in values}
+                    for name, values in response.context['facets'].items()}
+    assert facets_shown['category'] == {'ales': (1, False), 'stouts': (1, True)}
+    assert facets_shown['ingredient'] == {str(oats.id): (1, True)}
+    response = client.get(reverse('recipes'), {'category': 'ales', 'abv': '0-4'})
+    assert [value['key'] for value in response.context['facets']['category']] == ['ales']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_votes_concurrent():
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='',
+                                   status='PD', votes=5)
+    users = [User.objects.create_user(username=f'voter{number}', password='test') for number in range(40)]
+
+    def vote(user):
+        try:
+            return cast_vote(recipe.id, user)
+        finally:
+            connection.close()
+
+    # every user votes twice at the same time (the two votes are submitted next to each other,
+    # so they run in parallel), only one of them counts
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(vote, [user for user in users for _ in (0, 1)]))
+    assert results.count(True) == len(users)
+    assert RecipeVote.objects.filter(recipe=recipe).count() == len(users)
+
+    out = StringIO()
+    call_command('flush_recipe_votes', stdout=out)
+    assert out.getvalue() == 'updated votes of 1 recipes\n'
+    assert Recipe.objects.get(id=recipe.id).votes == 5 + len(users)
+    assert flush_vote_counts() == 0
+
+
+@pytest.mark.django_db
+def test_recipe_vote_view(client, random_user):
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='', status='PD')
+    draft = Recipe.objects.create(title='Draft', slug='draft', description='', prep_description='', status='DT')
+    url = reverse('recipe_vote', kwargs={'pk': recipe.id})
+    assert client.post(url).status_code == 302
+
+    client.force_login(random_user)
+    assert client.post(reverse('recipe_vote', kwargs={'pk': draft.id})).status_code == 404
+    assert client.post(url).json() == {'voted': True, 'changed': True, 'votes': 1}
+    assert client.post(url).json() == {'voted': True, 'changed': False, 'votes': 1}
+    # the page shows the same total as the endpoint, before the counters are flushed
+    details = client.get(reverse('recipe-details', kwargs={'pk': recipe.id}))
+    assert details.context['recipe'].voted and b'<span id="recipe-votes">1</span>' in details.content
+    assert client.delete(url).json() == {'voted': False, 'changed': True, 'votes': 0}
+    flush_vote_counts()
+    assert Recipe.objects.get(id=recipe.id).votes == 0
+
+    # votes deleted with their user are subtracted too, a recipe is deleted with its votes and counters
+    assert client.post(url).json()['votes'] == 1
+    flush_vote_counts()
+    random_user.delete()
+    assert current_votes(recipe.id) == 0
+    flush_vote_counts()
+    assert Recipe.objects.get(id=recipe.id).votes == 0
+    voter = User.objects.create_user(username='voter', password='test')
+    cast_vote(recipe.id, voter)
+    recipe.delete()
+    assert not RecipeVote.objects.exists()
+
+
+def uploaded_image(name, size):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@pytest.mark.django_db
+def test_thumbnails(settings, tmp_path, random_user):
+    settings.MEDIA_ROOT = tmp_path
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='',
+                                   status='PD', image=uploaded_image('pale.png', (1600, 900)))
+    profile = Profile.objects.create(user=random_user, avatar=uploaded_image('me.png', (80, 80)))
+    assert ThumbnailTask.objects.filter(status='PG').count() == 2
+    assert current_thumbnails(recipe) == {}
+
+    call_command('process_thumbnails', stdout=StringIO())
+    recipe.refresh_from_db()
+    thumbnails = current_thumbnails(recipe)
+    assert [width for width, _ in thumbnails['webp']] == [320, 640, 1280]
+    for width, name in thumbnails['webp'] + thumbnails['jpeg']:
+        assert name.startswith('beer_haven/recipes_img/pale.') and (tmp_path / name).exists()
+        assert Image.open(tmp_path / name).width == width
+    # the avatar is smaller than any thumbnail width
+    profile.refresh_from_db()
+    assert [width for width, _ in current_thumbnails(profile)['jpeg']] == [80]
+
+    html = Template("{% load beer_haven_images %}{% responsive_image recipe width=500 %}").render(
+        Context({'recipe': recipe}))
+    assert f'src="/media/{thumbnails["jpeg"][1][1]}"' in html
+    assert f'/media/{thumbnails["webp"][0][1]} 320w' in html
+
+    # a replaced image is served as the original until its thumbnails are generated
+    recipe.image = uploaded_image('stout.png', (800, 600))
+    recipe.save()
+    assert current_thumbnails(recipe) == {}
+    out = StringIO()
+    call_command('backfill_thumbnails', stdout=out)
+    assert 'beer_haven.recipe: queued 0 images' in out.getvalue()
+    # thumbnails of the replaced image are deleted once the new ones are stored
+    call_command('process_thumbnails', stdout=StringIO())
+    recipe.refresh_from_db()
+    assert current_thumbnails(recipe)['webp'][0][1].startswith('beer_haven/recipes_img/stout.')
+    assert not any((tmp_path / name).exists() for width, name in thumbnails['webp'] + thumbnails['jpeg'])
+    Recipe.objects.filter(id=recipe.id).update(thumbnails={})
+    call_command('backfill_thumbnails', model=['beer_haven.recipe'], stdout=StringIO())
+    assert ThumbnailTask.objects.filter(status='PG').count() == 1
+
+
+@pytest.mark.django_db
+def test_dictionary_pages(client, django_assert_num_queries):
+    titles = [f'{letter}{number}' for letter in 'ABC' for number in range(30)] + ['1 IBU']
+    Dictionary.objects.bulk_create([Dictionary(title=title, slug=title.lower().replace(' ', '-'), content='x ' * 500)
+                                    for title in titles])
+    cache.clear()
+
+    # count, page, letter index
+    with django_assert_num_queries(3):
+        response = client.get(reverse('dictionary'))
+    assert response.content.count(b'<h5>') == 50
+    with django_assert_num_queries(0):
+        assert client.get(reverse('dictionary')).content == response.content
+
+    response = client.get(reverse('dictionary'), {'letter': 'b', 'page': 1})
+    assert b'B29' in response.content and b'A0<' not in response.content
+    response = client.get(reverse('dictionary'), {'letter': '#'})
+    assert response.content.count(b'<h5>') == 1
+    assert b'?letter=A">A</a>' in response.content and b'<span class="text-muted">D</span>' in response.content
+    assert client.get(reverse('dictionary'), {'page': 9}).status_code == 404
+
+    Dictionary.objects.create(title='Ale', slug='ale', content='Top fermented beer')
+    assert b'>Ale</a>' in client.get(reverse('dictionary')).content
+    response = client.get(reverse('dictionary_entry', kwargs={'slug': 'ale'}))
+    assert response.context['entry'].content == 'Top fermented beer'
+    assert client.get(reverse('dictionary_entry', kwargs={'slug': 'lager'})).status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('orders', [3, 30])
+def test_admin_changelist_query_budget(client, orders, django_assert_num_queries):
+    admin_user = User.objects.create_superuser(username='admin', password='test', email='admin@example.com')
+    client.force_login(admin_user)
+    category = Category.objects.create(name='Malts', slug='malts')
+    for number in range(orders):
+        user = User.objects.create_user(username=f'buyer{number}', password='test')
+        address = UserAddress.objects.create(user=user, city='Krakow', street='Long', building_nr=number)
+        UserOrder.objects.create(user=user, billing_address=address, shipping_address=address)
+        GuestOrder.objects.create(**GUEST_ORDER_DATA)
+        Ingredient.objects.create(name=f'Malt {number}', slug=f'malt-{number}', category=category, description='',
+                                  in_stock=True, price=number)
+
+    # session, user, estimated count, exact count of a small result, rows
+    with django_assert_num_queries(5):
+        response = client.get(reverse('admin:beer_haven_userorder_changelist'))
+    assert len(response.context['cl'].result_list) == orders
+    with django_assert_num_queries(5):
+        client.get(reverse('admin:beer_haven_guestorder_changelist'), {'paid__exact': 0})
+    # session, user, categories of the filter, filtered and full count, rows
+    with django_assert_num_queries(6):
+        response = client.get(reverse('admin:beer_haven_ingredient_changelist'), {'price_range': 1})
+    assert response.context['cl'].result_count == len([price for price in range(orders) if 10 <= price < 50])
+
+
+@pytest.mark.django_db
+def test_approximate_count_last_pages(client, recipe_set_up, settings, monkeypatch):
+    # estimates below the real count: the pages after the estimated last one are still served
+    monkeypatch.setitem(COUNT_STRATEGIES, 'estimate', lambda queryset: 1)
+    settings.RECIPES_COUNT_STRATEGY = 'estimate'
+    for _ in range(12):
+        create_fake_recipe()
+    expected = list(Recipe.objects.filter(status='PD'))
+    last = (len(expected) - 1) // 10 + 1
+    response = client.get(reverse('recipes'), {'page': last})
+    assert list(response.context['page_obj']) == expected[(last - 1) * 10:]
+    assert not response.context['page_obj'].has_next() and response.context['paginator'].num_pages == last
+    assert client.get(reverse('recipes'), {'page': last + 1}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_admin_changelist_last_pages(client, random_user, monkeypatch):
+    # an estimate of 6 orders (two pages) for 12: page 3 is not redirected with ?e=1
+    monkeypatch.setitem(COUNT_STRATEGIES, 'estimate_large', lambda queryset: 6)
+    monkeypatch.setattr(UserOrderAdmin, 'list_per_page', 5)
+    client.force_login(User.objects.create_superuser(username='admin', password='test', email='admin@example.com'))
+    for _ in range(12):
+        UserOrder.objects.create(user=random_user)
+    response = client.get(reverse('admin:beer_haven_userorder_changelist'), {'p': 3})
+    assert response.status_code == 200 and len(response.context['cl'].result_list) == 2
+    assert response.context['cl'].paginator.num_pages == 3
+    assert client.get(reverse('admin:beer_haven_userorder_changelist'), {'p': 4}).status_code == 302
+
+
+@pytest.mark.django_db
+def test_admin_recipe_ingredient_inline(client, django_assert_max_num_queries):
+    admin_user = User.objects.create_superuser(username='admin', password='test', email='admin@example.com')
+    client.force_login(admin_user)
+    category = Category.objects.create(name='Malts', slug='malts')
+    malt = Ingredient.objects.create(name='Pale malt', slug='pale-malt', category=category, description='Base malt',
+                                     in_stock=True, price=10)
+    recipes = Recipe.objects.bulk_create([
+        Recipe(title=f'Ale {number}', slug=f'ale-{number}', description='', prep_description='', status='PD')
+        for number in range(60)
+    ])
+    RecipeIngredient.objects.bulk_create([RecipeIngredient(recipe=recipe, ingredient=malt, amount=1000, unit=0)
+                                          for recipe in recipes])
+    url = reverse('admin:beer_haven_ingredient_change', args=[malt.id])
+
+    # the number of queries does not depend on the number of rows
+    with django_assert_max_num_queries(12):
+        response = client.get(url)
+    formset = response.context['inline_admin_formsets'][0].formset
+    assert len(formset.initial_forms) == 50
+    assert b'<option value="%d" selected>Ale 59</option>' % recipes[-1].id in response.content
+
+    data = {'name': malt.name, 'slug': malt.slug, 'category': category.id, 'description': malt.description, 'in_stock': 'on',
+            'price': '10'}
+    data.update({f'{formset.prefix}-{key}': value for key, value in formset.management_form.initial.items()})
+    data[f'{formset.prefix}-TOTAL_FORMS'] = 51
+    for number, form in enumerate(formset.initial_forms):
+        data.update({f'{formset.prefix}-{number}-{name}': getattr(form.instance, attname)
+                     for name, attname in [('id', 'id'), ('recipe', 'recipe_id'), ('amount', 'amount'), ('unit', 'unit')]})
+    changed, deleted = formset.initial_forms[0].instance, formset.initial_forms[1].instance
+    data[f'{formset.prefix}-0-amount'] = 2000
+    data[f'{formset.prefix}-1-DELETE'] = 'on'
+    data.update({f'{formset.prefix}-50-recipe': recipes[0].id, f'{formset.prefix}-50-amount': 500,
+                 f'{formset.prefix}-50-unit': 0})
+    # a row added meanwhile pushes the oldest shown one out of the newest 50, it is still saved
+    oldest = formset.initial_forms[49].instance
+    data[f'{formset.prefix}-49-amount'] = 3000
+    extra_recipe = Recipe.objects.create(title='Stout', slug='stout', description='', prep_description='', status='PD')
+    RecipeIngredient.objects.create(recipe=extra_recipe, ingredient=malt, amount=1000, unit=0)
+    # only the 4 changed rows are validated, they are saved with one query per operation
+    with django_assert_max_num_queries(30):
+        response = client.post(url, data)
+    assert response.status_code == 302
+    assert RecipeIngredient.objects.get(id=changed.id).amount == 2000
+    assert RecipeIngredient.objects.get(id=oldest.id).amount == 3000
+    assert not RecipeIngredient.objects.filter(id=deleted.id).exists()
+    costs = dict(Recipe.objects.filter(id__in=[changed.recipe_id, deleted.recipe_id, recipes[0].id])
+                 .values_list('id', 'ingredients_cost'))
+    assert costs == {changed.recipe_id: Decimal('20.00'), deleted.recipe_id: Decimal('0.00'),
+                     recipes[0].id: Decimal('15.00')}
+
+
+@pytest.mark.django_db
+def test_import_ingredients(client, tmp_path, django_assert_num_queries):
+    category = Category.objects.create(name='Malts', slug='malts')
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'Malt {number}', slug=f'malt-{number}', category=category, description='', in_stock=True,
+                   price=10) for number in range(25)
+    ])
+    recipe = Recipe.objects.create(title='Pale ale', slug='pale-ale', description='', prep_description='', status='PD')
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=Ingredient.objects.get(slug='malt-0'), amount=2, unit=1)
+    assert Recipe.objects.get(id=recipe.id).ingredients_cost == Decimal('20.00')
+
+    rows = ['slug,price,in_stock,description', 'malt-0,12.50,,', 'malt-1,10,no,Pilsner malt', 'malt-2,10.00,yes,',
+            'hops,3,yes,', 'malt-3,cheap,yes,'] + [f'malt-{number},11,,' for number in range(4, 25)]
+    path = tmp_path / 'supplier.csv'
+    path.write_text('\n'.join(rows))
+    out = StringIO()
+    # 3 chunks of 10 rows: select and update each, recipe ids of price changes, search vectors, rollups
+    with django_assert_num_queries(13):
+        call_command('import_ingredients', str(path), chunk_size=10, stdout=out)
+    assert out.getvalue().splitlines()[:4] == [
+        '26 rows: 23 ingredients changed, 1 unchanged, 1 unknown slugs, 1 invalid rows',
+        'changed price: 22, in_stock: 1, description: 1',
+        'rollups of 1 recipes updated',
+        'unknown slugs: hops',
+    ]
+    assert "row 6: invalid price 'cheap'" in out.getvalue()
+    assert Recipe.objects.get(id=recipe.id).ingredients_cost == Decimal('25.00')
+    malt = Ingredient.objects.get(slug='malt-1')
+    assert (malt.in_stock, malt.description, malt.price) == (False, 'Pilsner malt', Decimal('10.00'))
+
+    # a JSON array is read in chunks, the dry run saves nothing
+    path = tmp_path / 'supplier.json'
+    path.write_text(json.dumps([{'slug': 'malt-0', 'price': 30}, {'slug': 'malt-1', 'in_stock': True}]))
+    out = StringIO()
+    call_command('import_ingredients', str(path), dry_run=True, stdout=out)
+    assert out.getvalue().startswith('2 rows: 2 ingredients changed')
+    assert Ingredient.objects.get(slug='malt-0').price == Decimal('12.50')
+
+    admin_user = User.objects.create_superuser(username='admin', password='test', email='admin@example.com')
+    client.force_login(admin_user)
+    upload = SimpleUploadedFile('supplier.jsonl', b'{"slug": "malt-0", "price": "30"}\n{"slug": "malt-1", "in_stock": 1}\n')
+    response = client.post(reverse('admin:beer_haven_ingredient_import'), {'file': upload}, follow=True)
+    assert '2 rows: 2 ingredients changed' in [str(message) for message in response.context['messages']][0]
+    assert Recipe.objects.get(id=recipe.id).ingredients_cost == Decimal('60.00')
+
+
+@pytest.mark.django_db
+def test_export_orders(client, random_user, django_assert_num_queries):
+    category = Category.objects.create(name='Malts', slug='malts')
+    malt = Ingredient.objects.create(name='Pale malt', slug='pale-malt', category=category, description='',
+                                     in_stock=True, price=Decimal('12.35'))
+    guest_order = GuestOrder.objects.create(**GUEST_ORDER_DATA)
+    GuestOrderItem.objects.bulk_create_items([GuestOrderItem(order=guest_order, ingredient=malt, amount=0.3,
+                                                             price=malt.price) for _ in range(2)])
+    user_order = UserOrder.objects.create(user=random_user)
+    old_order = UserOrder.objects.create(user=random_user)
+    Order.objects.filter(id=old_order.id).update(created=timezone.now() - timedelta(days=40))
+    since = timezone.localdate() - timedelta(days=7)
+
+    out = StringIO()
+    # one query per order type, items and ingredients are joined
+    with django_assert_num_queries(2):
+        call_command('export_orders', f'--since={since}', format='jsonl', stdout=out)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(row['order_id'], row['order_type']) for row in rows] == [
+        (guest_order.id, 'guest'), (guest_order.id, 'guest'), (user_order.id, 'user')]
+    assert (rows[0]['ingredient'], rows[0]['amount'], rows[0]['cost'], rows[0]['order_total']) == (
+        'Pale malt', 0.3, '3.71', '7.42')
+    assert rows[2]['customer'] == random_user.username and rows[2]['item_id'] is None
+
+    url = reverse('order_export')
+    client.force_login(random_user)
+    assert client.get(url, {'since': since}).status_code == 403
+    random_user.is_staff = True
+    random_user.save()
+    response = client.get(url, {'since': since})
+    assert response.streaming and response['Content-Disposition'].startswith('attachment; filename="orders-')
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0].startswith('order_id,order_type,created') and len(lines) == 4
+    assert client.get(url, {'since': 'yesterday'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_customer_order_layout(random_user, django_assert_num_queries):
+    category = Category.objects.create(name='Malts', slug='malts')
+    malts = [Ingredient.objects.create(name=f'Malt {i}', slug=f'malt-{i}', category=category, description='',
+                                       in_stock=True, price=Decimal('12.35')) for i in range(3)]
+    cart = [{'ingredient': malt, 'price': malt.price, 'amount': Decimal('0.5')} for malt in malts]
+    form = GuestOrderCreateForm(GUEST_ORDER_DATA)
+    assert form.is_valid()
+    with CaptureQueriesContext(connection) as mti_queries:
+        guest_order = create_order_from_cart(form, cart, GuestOrderItem)
+    user_order = UserOrder.objects.create(user=random_user)
+    Order.objects.filter(id=user_order.id).update(created=timezone.now() - timedelta(days=3))
+
+    # batch_size=1: every row in its own batch, the copy keeps ids, timestamps and totals
+    copied = copy_orders(apps, connection, batch_size=1)
+    assert copied == {'guest orders': 1, 'user orders': 1, 'guest order items': 3, 'user order items': 0}
+    assert copy_orders(apps, connection) == dict.fromkeys(copied, 0)
+    copy = CustomerOrder.objects.get(id=guest_order.id)
+    assert (copy.guest_email, copy.total, copy.created, copy.is_guest) == (
+        guest_order.guest_email, guest_order.total, guest_order.created, True)
+    assert sorted(copy.items.values_list('ingredient_id', flat=True)) == [malt.id for malt in malts]
+    assert CustomerOrder.objects.get(id=user_order.id).user == random_user
+    assert CustomerOrder.objects.get(id=user_order.id).created < copy.created
+
+    # lock, order INSERT and items INSERT (+ savepoint and its release) instead of two INSERTs per row
+    with django_assert_num_queries(5):
+        order = create_customer_order(GUEST_ORDER_DATA, cart)
+    assert len(mti_queries) > 5
+    assert order.id > user_order.id and order.total == guest_order.total == Decimal('18.54')
+    assert CustomerOrderItem.objects.filter(order=order).count() == 3
+
+    # both layouts take ids from the same sequences: an order created after the native one gets a new id,
+    # a later run copies it, updates the changed one and does not touch the native order
+    later_order = GuestOrder.objects.create(**GUEST_ORDER_DATA)
+    GuestOrderItem.objects.bulk_create_items([GuestOrderItem(order=later_order, ingredient=malts[0], amount=2,
+                                                             price=malts[0].price)])
+    Order.objects.filter(id=guest_order.id).update(paid=True)
+    assert later_order.id > order.id
+    assert copy_orders(apps, connection) == {
+        'guest orders': 2, 'user orders': 0, 'guest order items': 1, 'user order items': 0}
+    assert CustomerOrder.objects.get(id=guest_order.id).paid
+    assert CustomerOrder.objects.get(id=later_order.id).items.get().amount == 2
+    native = CustomerOrder.objects.get(id=order.id)
+    assert not native.paid and native.items.count() == 3
+
+    # items edited one by one (admin inline) keep the total in sync
+    item = native.items.first()
+    item.amount = 1.5
+    item.save()
+    native.refresh_from_db()
+    assert native.total == Decimal('30.89')
+    item.delete()
+    native.refresh_from_db()
+    assert native.total == Decimal('12.36')
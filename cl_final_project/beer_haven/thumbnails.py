@@ -0,0 +1,141 @@
+import hashlib
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import invalidate_recipes
+from .models import ThumbnailTask
+from .outbox import backoff, claim_due
+
+# image field and thumbnail widths of every model with images
+THUMBNAILS = {
+    'beer_haven.recipe': ('image', (320, 640, 1280)),
+    'beer_haven.ingredient': ('image', (160, 320, 640)),
+    'beer_haven.profile': ('avatar', (100, 200, 400)),
+}
+# https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+
+
+def image_field(instance):
+    return THUMBNAILS[instance._meta.label_lower][0]
+
+
+def queue_thumbnails(instance):
+    """ Stores a task for the current image of the instance. Called in the transaction which saved it,
+        so the worker never sees a task of an image that was not committed."""
+    return ThumbnailTask.objects.create(
+        model=instance._meta.label_lower, object_id=instance.pk, source=getattr(instance, image_field(instance)).name
+    )
+
+
+def thumbnail_name(source, width, content, extension):
+    """ Thumbnails are stored beside the original, the name contains a hash of the content: a changed
+        image always gets new names, so thumbnails can be served with far-future, immutable caching."""
+    stem, _ = os.path.splitext(source)
+    return f'{stem}.{width}w.{hashlib.sha256(content).hexdigest()[:12]}.{extension}'
+
+
+def render_thumbnails(file, widths):
+    """ yields (extension, width, encoded image) of every width not larger than the original """
+    with Image.open(file) as original:
+        # phones store the rotation in EXIF only
+        image = ImageOps.exif_transpose(original)
+        widths = [width for width in widths if width <= image.width] or [image.width]
+        for width in widths:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for extension, (image_format, options) in FORMATS.items():
+                if image_format == 'JPEG' and resized.mode != 'RGB':
+                    resized = resized.convert('RGB')
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                yield extension, width, buffer.getvalue()
+
+
+def generate_thumbnails(source, widths, storage=default_storage):
+    """ Writes thumbnails of the source file, returns the value of the model's thumbnails field:
+        {'source': name of the original, 'webp': [[width, name], ...], 'jpeg': [...]}.
+        Files already in the storage (the same content) are not written again."""
+    thumbnails = {'source': source, **{extension: [] for extension in FORMATS}}
+    with storage.open(source) as file:
+        for extension, width, content in render_thumbnails(file, widths):
+            name = thumbnail_name(source, width, content, extension)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(content))
+            thumbnails[extension].append([width, name])
+    return thumbnails
+
+
+def delete_thumbnails(thumbnails, keep=(), storage=default_storage):
+    """ deletes files of a thumbnails field value except the names in keep (files of the current value) """
+    for extension in FORMATS:
+        for width, name in (thumbnails or {}).get(extension, []):
+            if name not in keep:
+                storage.delete(name)
+
+
+def claim_batch(batch_size):
+    """ takes up to batch_size due tasks, locked ones are skipped and claimed ones leased, see outbox.claim_due """
+    return claim_due(ThumbnailTask, batch_size, LEASE)
+
+
+def process_task(task):
+    """ Generates thumbnails of the task's image. They are stored only if the object still has that image -
+        an image replaced in the meantime has its own task - and the files of the previous thumbnails are
+        deleted. Failures are retried with backoff."""
+    field, widths = THUMBNAILS[task.model]
+    objects = apps.get_model(task.model).objects.filter(pk=task.object_id, **{field: task.source})
+    task.attempts += 1
+    try:
+        # a list with the previous value, empty if the object has another image
+        previous = list(objects.values_list('thumbnails', flat=True))
+        if previous:
+            thumbnails = generate_thumbnails(task.source, widths)
+            if objects.update(thumbnails=thumbnails):
+                current = {name for extension in FORMATS for _, name in thumbnails[extension]}
+                delete_thumbnails(previous[0], keep=current)
+                if task.model == 'beer_haven.recipe':
+                    # update() sends no signals, the recipe body with the image is cached
+                    invalidate_recipes([task.object_id])
+    except Exception as error:
+        task.last_error = f'{type(error).__name__}: {error}'
+        if task.attempts >= MAX_ATTEMPTS:
+            task.status = 'FL'
+        else:
+            task.next_attempt_at = timezone.now() + timedelta(seconds=backoff(task.attempts))
+    else:
+        task.status = 'DN'
+        task.last_error = ''
+
+
+def process_thumbnails(batch_size=10):
+    """ processes due tasks batch after batch until there are none, returns number of processed tasks """
+    processed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return processed
+        for task in batch:
+            process_task(task)
+        ThumbnailTask.objects.bulk_update(batch, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+        processed += len(batch)
+
+
+def current_thumbnails(instance):
+    """ thumbnails of the instance's current image, empty until the worker has processed it """
+    thumbnails = instance.thumbnails or {}
+    if thumbnails.get('source') != getattr(instance, image_field(instance)).name:
+        return {}
+    return thumbnails
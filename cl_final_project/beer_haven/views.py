@@ -1,71 +1,110 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views import View
 
 from django.contrib.auth import get_user_model, login, logout
 from django.contrib.auth.views import LoginView
 from django.views.decorators.http import require_POST
+from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.contrib.postgres.search import SearchVector
 from django.contrib import messages
 from django.views.generic import ListView, FormView, CreateView, UpdateView, DetailView
 from django.urls import reverse_lazy, reverse
-from django.core.mail import send_mail
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, prefetch_related_objects
+from django.db.models.functions import Left
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils import timezone
 import stripe
 
-from decimal import Decimal
-from stripe.error import StripeError
-from .cart import Cart
-from .forms import LoginForm, SearchForm, UserRegistrationForm, UserProfileForm, UserAddressForm, CartAddIngredientForm, GuestOrderCreateForm
-from .models import Dictionary, Recipe, Ingredient, ExperienceTip, Profile, UserAddress, GuestOrderItem, GuestOrder
-from cl_final_project.settings import EMAIL_HOST_USER, STRIPE_SECRET_KEY, STRIPE_API_VERSION
+import json
+from urllib.parse import urlencode
+from stripe.error import SignatureVerificationError
+from .cart import Cart, CartLimitError
+from .search import search_recipes, autocomplete
+from .facets import parse_filters, apply_filters, cached_facet_counts, facet_links
+from .pagination import ApproximateCountPaginator, KeysetPaginator
+from .caching import recipe_body_key, recent_recipes, dictionary_page_key, RECIPE_BODY_TIMEOUT, DICTIONARY_PAGE_TIMEOUT
+from .dictionary import parse_letter, filter_letter, letter_index, DICTIONARY_PAGE_SIZE, EXCERPT_LENGTH
+from .orders import create_order_from_cart, OutOfStockError
+from .outbox import queue_email
+from .payments import get_checkout_url, PaymentGatewayError
+from .webhooks import record_events
+from .votes import cast_vote, withdraw_vote, current_votes, votes_with_pending
+from .exports import export_rows, date_range, FORMATS as EXPORT_FORMATS
+from .forms import LoginForm, SearchForm, UserRegistrationForm, UserProfileForm, UserAddressForm, CartAddIngredientForm, CartAddRecipeForm, GuestOrderCreateForm, OrderExportForm
+from .models import Dictionary, Recipe, RecipeIngredient, Ingredient, Profile, UserAddress, GuestOrderItem, GuestOrder, RecipeVote
+from cl_final_project.settings import EMAIL_HOST_USER
 
 
 # Create your views here.
 User = get_user_model()
-stripe.api_key = STRIPE_SECRET_KEY
-stripe.api_version = STRIPE_API_VERSION
 
 
 class IndexView(View):
+    """ Landing page. Recent recipes come from the cache (see caching.recent_recipes),
+        so anonymous visitors are served without database queries. """
     def get(self, request):
         # form = SearchForm()
 
         context = {
-            'recent_recipes': Recipe.objects.all().filter(status='PD')[:3],
+            'recent_recipes': recent_recipes(),
             # 'form': form,
         }
         return render(request, "beer_haven/index.html", context)
 
 
 class SearchView(View):
+    """Full-text recipe search. The query is matched against the stored, GIN-indexed
+    Recipe.search_vector and results are ordered by rank and paginated.
+    GET with ?query= is used by pagination links, POST keeps the old form working."""
+    template_name = "beer_haven/search.html"
+    paginate_by = 10
+
     def get(self, request):
-        form = SearchForm()
-        return render(request, "beer_haven/search.html", {'form': form})
+        if 'query' not in request.GET:
+            return render(request, self.template_name, {'form': SearchForm()})
+        return self.search(request, SearchForm(request.GET))
 
     def post(self, request, *args, **kwargs):
-        form = SearchForm(request.POST)
+        return self.search(request, SearchForm(request.POST))
+
+    def search(self, request, form):
         if form.is_valid():
             query = form.cleaned_data['query']
-            # https://docs.djangoproject.com/en/4.2/ref/contrib/postgres/search/
-            results = Recipe.objects.annotate(
-                search=SearchVector('title', 'description', 'prep_description', 'ingredients__name', 'categories__name'),
-            ).filter(search__icontains=query).values('pk').distinct()
-            # getting ids
-            recipe_ids = [result['pk'] for result in results]
-
-            # finding full objects
-            unique_results = Recipe.objects.filter(pk__in=recipe_ids)
+            paginator = Paginator(search_recipes(query), self.paginate_by)
+            page_obj = paginator.get_page(request.GET.get('page'))
 
             context = {
-
                 'form': form,
                 'query': query,
-                'results': unique_results
+                'results': page_obj.object_list,
+                'paginator': paginator,
+                'page_obj': page_obj,
+                'is_paginated': page_obj.has_other_pages(),
             }
-            return render(request, "beer_haven/search.html", context)
-        return render(request, "beer_haven/search.html", {'form': form})
+            return render(request, self.template_name, context)
+        return render(request, self.template_name, {'form': form})
+
+
+class AutocompleteView(View):
+    """Lightweight JSON suggestions for the search form, served from the trigram
+    indexes (and the in-process prefix cache) instead of the full-text search."""
+    def get(self, request):
+        suggestions = autocomplete(request.GET.get('q', ''))
+        results = []
+        for suggestion in suggestions:
+            url = None
+            if suggestion['kind'] == 'recipe':
+                url = reverse('recipe-details', kwargs={'pk': suggestion['pk']})
+            results.append({**suggestion, 'url': url})
+        return JsonResponse({'results': results})
 
 
 class LoginView(FormView):
@@ -147,37 +186,191 @@ class UserDetails(LoginRequiredMixin, UserPassesTestMixin, DetailView):
 
 
 class DictionaryView(ListView):
-    """Renders Dictionary Page using generic ListView"""
+    """Dictionary pages with an A-Z index, ?letter= shows entries of one letter. Entries are listed with
+    an excerpt of the content. The listing (index, entries, pagination) is rendered once per letter and page
+    and served from cache until any entry changes, see beer_haven.dictionary and beer_haven.caching."""
     template_name = 'beer_haven/dictionary.html'
+    listing_template_name = 'beer_haven/dictionary-listing.html'
     model = Dictionary
     context_object_name = 'entries'
+    paginate_by = DICTIONARY_PAGE_SIZE
+
+    def get_queryset(self):
+        queryset = super().get_queryset().defer('content').annotate(excerpt=Left('content', EXCERPT_LENGTH))
+        if self.letter:
+            queryset = filter_letter(queryset, self.letter)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['letters'] = letter_index()
+        context['letter'] = self.letter
+        context['filter_query'] = urlencode({'letter': self.letter}) if self.letter else ''
+        return context
+
+    def get_listing(self):
+        page = self.request.GET.get(self.page_kwarg, '1')
+        # other page values ('last', invalid ones) are not cached
+        key = dictionary_page_key(self.letter, page) if page.isdigit() else None
+        listing = cache.get(key) if key else None
+        if listing is None:
+            self.object_list = self.get_queryset()
+            listing = render_to_string(self.listing_template_name, self.get_context_data())
+            if key:
+                cache.set(key, listing, DICTIONARY_PAGE_TIMEOUT)
+        return mark_safe(listing)
+
+    def get(self, request, *args, **kwargs):
+        self.letter = parse_letter(request.GET.get('letter'))
+        return render(request, self.template_name, {'listing': self.get_listing()})
+
+
+class DictionaryEntryView(DetailView):
+    """Dictionary entry by slug"""
+    template_name = 'beer_haven/dictionary-entry.html'
+    model = Dictionary
+    context_object_name = 'entry'
+
+    def get_object(self, queryset=None):
+        # slugs are not unique, the oldest entry wins
+        entry = Dictionary.objects.filter(slug=self.kwargs['slug']).order_by('id').first()
+        if entry is None:
+            raise Http404('No dictionary entry found')
+        return entry
 
 
 class RecipesListView(ListView):
-    """Renders Recipes List View using generic ListView"""
+    """Renders Recipes List View using generic ListView.
+    settings.RECIPES_PAGINATION switches between the default 'offset' pagination (?page=)
+    and 'keyset' pagination (?cursor=), which does not use OFFSET and COUNT(*).
+    settings.RECIPES_COUNT_STRATEGY ('estimate' or 'cached') replaces the exact COUNT(*).
+    ?sort= orders by the denormalized ingredient rollups (cost, missing ingredients), no joins needed.
+    ?category=, ?abv=, ?ingredient= and ?votes= filter the list, counts of all facet values come
+    from one (cached) query, see beer_haven.facets."""
     template_name = "beer_haven/recipes-list.html"
     model = Recipe
     context_object_name = 'recipes'
     paginate_by = 10
+    # the last field of every ordering is unique, as keyset pagination requires
+    sort_orderings = {
+        'newest': ('-published', 'id'),
+        'cheapest': ('ingredients_cost', 'id'),
+        'priciest': ('-ingredients_cost', '-id'),
+        'available': ('missing_ingredients', '-published', 'id'),
+    }
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.sort_orderings else 'newest'
+
+    def get_ordering(self):
+        return self.sort_orderings[self.get_sort()]
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset.filter(status='PD')
+        self.filters = parse_filters(self.request.GET)
+        return apply_filters(queryset.filter(status='PD'), self.filters)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        counts = cached_facet_counts(Recipe.objects.filter(status='PD'), self.filters)
+        context['facets'] = facet_links(self.request.GET, counts, self.filters)
+        # current filters and sort for pagination links, sort links keep the filters
+        params = self.request.GET.copy()
+        for name in ('page', 'cursor'):
+            params.pop(name, None)
+        context['filter_query'] = params.urlencode()
+        context['sort'] = self.get_sort()
+        context['sorts'] = []
+        for sort in self.sort_orderings:
+            params['sort'] = sort
+            context['sorts'].append({'name': sort, 'query': params.urlencode()})
+        return context
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        count_strategy = getattr(settings, 'RECIPES_COUNT_STRATEGY', None)
+        if count_strategy is None:
+            return super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+        return ApproximateCountPaginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            count_strategy=count_strategy, **kwargs
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if getattr(settings, 'RECIPES_PAGINATION', 'offset') != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(
+            queryset, page_size,
+            ordering=self.get_ordering(),
+            count_strategy=getattr(settings, 'RECIPES_COUNT_STRATEGY', None),
+        )
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class RecipeVoteView(LoginRequiredMixin, View):
+    """Voting API of published recipes: POST casts the user's vote, DELETE withdraws it.
+    Returns JSON with the vote state and the current number of votes, see beer_haven.votes."""
+
+    def get_recipe_id(self, pk):
+        return get_object_or_404(Recipe.objects.filter(status='PD').values_list('id', flat=True), pk=pk)
+
+    def response(self, recipe_id, voted, changed):
+        return JsonResponse({'voted': voted, 'changed': changed, 'votes': current_votes(recipe_id)})
+
+    def post(self, request, pk):
+        recipe_id = self.get_recipe_id(pk)
+        return self.response(recipe_id, True, cast_vote(recipe_id, request.user))
+
+    def delete(self, request, pk):
+        recipe_id = self.get_recipe_id(pk)
+        return self.response(recipe_id, False, withdraw_vote(recipe_id, request.user))
 
 
 class RecipeDetailsView(DetailView):
+    """Recipe details. The recipe body (description, categories, ingredients, image) is
+    rendered once per recipe version and served from cache, see beer_haven.caching.
+    On a cache miss categories and ingredients are prefetched, experience tips (staff only,
+    never cached) are prefetched as well, so the number of queries does not depend on recipe size."""
     model = Recipe
     template_name = 'beer_haven/recipe-details.html'
+    body_template_name = 'beer_haven/recipe-body.html'
     context_object_name = 'recipe'
 
+    def is_admin_or_superuser(self):
+        return self.request.user.is_authenticated and self.request.user.is_staff
+
+    def get_queryset(self):
+        # the same number the vote endpoint returns, with votes not flushed yet
+        queryset = super().get_queryset().annotate(current_votes=votes_with_pending())
+        if self.is_admin_or_superuser():
+            queryset = queryset.prefetch_related('tips')
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(voted=Exists(
+                RecipeVote.objects.filter(recipe=OuterRef('pk'), user=self.request.user)
+            ))
+        return queryset
+
+    def get_recipe_body(self, recipe):
+        key = recipe_body_key(recipe.pk)
+        body = cache.get(key)
+        if body is None:
+            # https://docs.djangoproject.com/en/4.2/ref/models/querysets/#prefetch-related-objects
+            prefetch_related_objects(
+                [recipe],
+                'categories',
+                Prefetch('recipe_ingredients', queryset=RecipeIngredient.objects.select_related('ingredient')),
+            )
+            body = render_to_string(self.body_template_name, {'recipe': recipe})
+            cache.set(key, body, RECIPE_BODY_TIMEOUT)
+        return mark_safe(body)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data()
-        experience_tips = ExperienceTip.objects.filter(recipe=context['recipe'])
-        context['experience_tips'] = experience_tips
-        if self.request.user.is_authenticated and self.request.user.is_staff:
-            context['admin_or_superuser'] = True
-        else:
-            context['admin_or_superuser'] = False
+        context['recipe_body'] = self.get_recipe_body(context['recipe'])
+        # tips are rendered only for staff, for other users this queryset is never evaluated
+        context['experience_tips'] = context['recipe'].tips.all()
+        context['admin_or_superuser'] = self.is_admin_or_superuser()
 
         return context
 
@@ -236,11 +429,14 @@ class CartAddView(View):
         form = CartAddIngredientForm(request.POST)
         if form.is_valid():
             cd = form.cleaned_data
-            cart.add(
-                ingredient=ingredient,
-                amount=cd['amount'],
-                override_amount=cd['override']
-            )
+            try:
+                cart.add(
+                    ingredient=ingredient,
+                    amount=cd['amount'],
+                    override_amount=cd['override']
+                )
+            except CartLimitError as error:
+                messages.error(request, error)
         return redirect('cart_details')
 
 
@@ -248,19 +444,36 @@ class CartAddView(View):
 class CartAddRecipeView(View):
     """ View to add all recipe ingredients to the shopping cart / update the amount of products already in it.
         The require_post decorator makes sure that only post requests are allowed.
-        The view gets the ingredient_id parameter based on this id we retrieve the corresponding copy
-        of the Ingredient model.
-        If the form is valid we add the product to the cart and are redirected to the cart details page.
+        Recipe ingredients are fetched with one query (together with the ingredients and recipe batch volume)
+        and added to the cart with one session write. The optional `litres` field scales the recipe
+        from its batch_volume to the given number of litres.
 
         """
     def post(self, request, recipe_id):
         cart = Cart(request)
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        cart.add_recipe(recipe)
+        form = CartAddRecipeForm(request.POST)
+        if not form.is_valid():
+            messages.error(request, 'Enter the number of litres between 0.5 and 1000.')
+            return redirect('cart_details')
+        recipe_ingredients = list(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id)
+            .select_related('ingredient')
+            .annotate(batch_volume=F('recipe__batch_volume'))
+            .order_by('id')
+        )
+        if not recipe_ingredients:
+            # nothing to add, only a missing recipe is an error
+            get_object_or_404(Recipe, id=recipe_id)
+            return redirect('cart_details')
+        litres = form.cleaned_data['litres']
+        multiplier = litres / recipe_ingredients[0].batch_volume if litres else 1
+        try:
+            cart.add_recipe(recipe_ingredients, multiplier)
+        except CartLimitError as error:
+            messages.error(request, error)
         return redirect('cart_details')
 
 
-
 @method_decorator(require_POST, name='dispatch')
 class CartRemoveView(View):
     """ The view gets the ingredient_id parameter, based on this id it retrieves the corresponding instance
@@ -319,8 +532,9 @@ class GuestOrderCreateView(View):
     """Guest order processing view.
     In the get method displays a form about the visitor's data and the contents
     of the shopping cart. In the post method, the shopping cart is saved to the
-    database in the GuestOrderItem table, a notification email is sent, and the
-    shopping cart is cleared. A redirection to the payment gateway follows. """
+    database in the GuestOrderItem table (atomically and in bulk, see orders.create_order_from_cart),
+    a notification email is queued in the outbox, and the shopping cart is cleared.
+    A redirection to the payment gateway follows. """
 
     guest_order_form = GuestOrderCreateForm
     template_name = 'beer_haven/order-create.html'
@@ -334,15 +548,15 @@ class GuestOrderCreateView(View):
         cart = Cart(request)
         form = self.guest_order_form(request.POST)
         if form.is_valid():
-            guest_order = form.save()
-            for item in cart:
-                GuestOrderItem.objects.create(
-                    order=guest_order,
-                    ingredient=item['ingredient'],
-                    price=item['price'],
-                    amount=item['amount'],
-                )
-            self.send_order_email(guest_order, cart)
+            # cart is read (one Ingredient query) once, for the order and the email
+            lines = list(cart)
+            try:
+                with transaction.atomic():
+                    guest_order = create_order_from_cart(form, lines, GuestOrderItem)
+                    self.queue_order_email(guest_order, lines)
+            except OutOfStockError as error:
+                form.add_error(None, str(error))
+                return render(request, self.template_name, {'form': form, 'cart': cart})
             cart.clear()
             request.session['order_id'] = guest_order.id
 
@@ -351,30 +565,32 @@ class GuestOrderCreateView(View):
             # return render(request, 'beer_haven/order-thx.html', {'order': guest_order})
         return render(request, self.template_name, {'form': form, 'cart': cart})
 
-    def send_order_email(self, order, cart):
+    def queue_order_email(self, order, lines):
+        """ The confirmation is stored in the outbox in the order transaction and sent
+            by the `send_outbox_emails` command, so a slow SMTP server does not block checkout."""
         subject = "order confirmation"
-        message = f'Order (id: {order.id}) was successfully pledged. \n total cost: {order.get_total_cost()} \n Details: \n'
-        for item in cart:
+        message = f'Order (id: {order.id}) was successfully pledged. \n total cost: {order.total} \n Details: \n'
+        for item in lines:
             message += f"{item['amount']} x {item['ingredient'].name} = {item['total_price']} \n"
         from_mail = EMAIL_HOST_USER
         recipient_mail = order.guest_email
-        send_mail(subject, message, from_mail, [recipient_mail])
+        queue_email(subject, message, from_mail, [recipient_mail])
 
 
 class PaymentProcess(View):
     """
     A view that supports the payment process. Get displays a template with an order
     summary and a button for payment. Clicking the button generates a POST request.
-    A Stripe service checkout session is created with the most relevant parameters,
-    success_url and cancel_url defined. Once the checkout session is created,
-    a redirect to the Stripe service is returned.
+    A checkout session of the payment gateway (Stripe) is created with the most relevant parameters,
+    success_url and cancel_url defined, or the still open one of this order is reused (see payments.py).
+    Then a redirect to the Stripe service is returned.
     """
     def get(self, request):
         order_id = request.session.get('order_id', None)
         order = get_object_or_404(GuestOrder, id=order_id)
-        print(order.id, order)
+        items = order.items.select_related('ingredient')
 
-        return render(request, 'beer_haven/payment-process.html', {'order': order})
+        return render(request, 'beer_haven/payment-process.html', {'order': order, 'items': items})
 
 
     def post(self, request):
@@ -384,30 +600,15 @@ class PaymentProcess(View):
         # https://stripe.com/docs/checkout/quickstart
         success_url = request.build_absolute_uri(reverse('payment_completed'))
         cancel_url = request.build_absolute_uri(reverse('payment_canceled'))
-        # https://stripe.com/docs/api/checkout/sessions/object
-        session_data = {
-            'mode': 'payment',
-            'client_reference_id': order.id,
-            'success_url': success_url,
-            'cancel_url': cancel_url,
-            'line_items': []
-        }
-
-        for item in order.items.all():
-            session_data['line_items'].append({
-                'price_data': {
-                    'unit_amount': int(item.price * 100),
-                    'currency': 'pln',
-                    'product_data': {
-                        'name': item.ingredient.name,
-                    },
-                },
-                'quantity': int(item.amount)
-            })
-
-        stripe_session = stripe.checkout.Session.create(**session_data)
+        try:
+            url = get_checkout_url(order, success_url, cancel_url)
+        except PaymentGatewayError:
+            messages.error(request, 'The payment service is not available at the moment, please try again.')
+            return redirect('payment_process')
 
-        return redirect(stripe_session.url, code=303) # 303 code recommended to redirect web applications to a new URI after a POST request is made
+        response = redirect(url)
+        response.status_code = 303 # 303 code recommended to redirect web applications to a new URI after a POST request is made
+        return response
 
 
 class PaymentCompleted(View):
@@ -419,3 +620,51 @@ class PaymentCanceled(View):
     def get(self, request):
         return render(request, 'beer_haven/payment-canceled.html', {})
 
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(require_POST, name='dispatch')
+class StripeWebhookView(View):
+    """ Endpoint of Stripe webhooks. The signature of the event is verified and the raw event is stored,
+        nothing else is done here - the process_payment_events command marks orders as paid in batches.
+        Stripe gets the answer right away and redelivered events are ignored. """
+    def post(self, request):
+        # anyone could sign events with an empty secret
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return HttpResponse('Stripe webhook secret is not configured', status=503)
+        # https://stripe.com/docs/webhooks#verify-events
+        payload = request.body.decode('utf-8', errors='replace')
+        try:
+            # the tolerance rejects replays of old signed events
+            stripe.WebhookSignature.verify_header(
+                payload, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET,
+                tolerance=stripe.Webhook.DEFAULT_TOLERANCE,
+            )
+            event = json.loads(payload)
+        except (ValueError, SignatureVerificationError):
+            return HttpResponseBadRequest()
+        record_events([event])
+        return HttpResponse()
+
+
+class OrderExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Staff only export of guest and user order lines created between ?since= and ?until= (dates, until
+    defaults to today) as ?format=csv (default) or jsonl. Rows are streamed while they are read from
+    the database, see beer_haven.exports."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        form = OrderExportForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        file_format = form.cleaned_data['format'] or 'csv'
+        lines, content_type = EXPORT_FORMATS[file_format]
+        first_day, last_day = form.cleaned_data['since'], form.cleaned_data['until'] or timezone.localdate()
+        since, until = date_range(first_day, last_day)
+        # https://docs.djangoproject.com/en/4.2/ref/request-response/#streaminghttpresponse-objects
+        response = StreamingHttpResponse(lines(export_rows(since, until)), content_type=content_type)
+        name = f'orders-{first_day}-{last_day}.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{name}"'
+        return response
@@ -0,0 +1,89 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Recipe, RecipeVote, RecipeVoteShard
+
+
+def _add_to_shard(recipe_id, delta):
+    """ Adds delta to a random shard of the recipe with a single UPDATE ... SET count = count + delta,
+        so concurrent votes neither overwrite each other nor wait for one hot row. Shards of a recipe
+        are created on its first vote, a concurrent creation is skipped by the unique constraint."""
+    # https://docs.djangoproject.com/en/4.2/ref/models/expressions/#avoiding-race-conditions-using-f
+    shard = random.randrange(settings.RECIPE_VOTE_SHARDS)
+    shards = RecipeVoteShard.objects.filter(recipe_id=recipe_id, shard=shard)
+    if not shards.update(count=F('count') + delta):
+        RecipeVoteShard.objects.bulk_create(
+            [RecipeVoteShard(recipe_id=recipe_id, shard=number) for number in range(settings.RECIPE_VOTE_SHARDS)],
+            ignore_conflicts=True,
+        )
+        shards.update(count=F('count') + delta)
+
+
+def cast_vote(recipe_id, user):
+    """ Records a vote of the user, returns False if the user has already voted for the recipe.
+        The vote row and the counter change are committed together."""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                RecipeVote.objects.create(recipe_id=recipe_id, user=user)
+        except IntegrityError:
+            return False
+        _add_to_shard(recipe_id, 1)
+    return True
+
+
+def withdraw_vote(recipe_id, user):
+    """ Removes the user's vote, returns False if there was none. The counter is decreased
+        by the post_delete receiver (signals.recipe_vote_deleted), in the same transaction."""
+    with transaction.atomic():
+        deleted, _ = RecipeVote.objects.filter(recipe_id=recipe_id, user=user).delete()
+    return bool(deleted)
+
+
+def remove_vote_from_counter(recipe_id):
+    """ subtracts a deleted vote - withdrawn, or deleted with its user - from the pending counters """
+    _add_to_shard(recipe_id, -1)
+
+
+def votes_with_pending():
+    """ Recipe.votes together with the changes not flushed yet, as an annotation of a Recipe queryset.
+        A subquery, so it can be combined with prefetches and other annotations."""
+    pending = (RecipeVoteShard.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+               .annotate(total=Sum('count')).values('total'))
+    return F('votes') + Coalesce(Subquery(pending), 0)
+
+
+def current_votes(recipe_id):
+    """ Recipe.votes together with the changes not flushed yet """
+    return Recipe.objects.filter(pk=recipe_id).annotate(current=votes_with_pending()).values_list('current', flat=True).get()
+
+
+def flush_vote_counts():
+    """ Moves pending shard counts to Recipe.votes: nonzero shards are locked, recipes are updated
+        with one query and the shards are reset with another. Votes cast meanwhile wait only for
+        the shard rows being flushed. Returns the number of updated recipes."""
+    with transaction.atomic():
+        shards = list(
+            RecipeVoteShard.objects.select_for_update()
+            .exclude(count=0)
+            .order_by('id')
+            .values_list('id', 'recipe_id', 'count')
+        )
+        if not shards:
+            return 0
+        deltas = {}
+        for _, recipe_id, count in shards:
+            deltas[recipe_id] = deltas.get(recipe_id, 0) + count
+        votes = PositiveIntegerField()
+        Recipe.objects.filter(pk__in=deltas).update(votes=Case(
+            *[When(pk=recipe_id, then=Greatest(F('votes') + delta, 0, output_field=votes))
+              for recipe_id, delta in deltas.items()],
+            default=F('votes'),
+            output_field=votes,
+        ))
+        RecipeVoteShard.objects.filter(pk__in=[shard_id for shard_id, _, _ in shards]).update(count=0)
+    return len(deltas)
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, PaymentEvent
+
+# https://stripe.com/docs/api/events/types#event_types-checkout.session.completed
+PAID_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+
+def record_events(events):
+    """ Appends raw events (dicts as sent by Stripe) with one INSERT. Redelivered events
+        (the same event id) are silently skipped by the unique constraint."""
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(event_id=event['id'], type=event['type'], payload=event) for event in events],
+        ignore_conflicts=True,
+    )
+
+
+def paid_order_id(event):
+    """ order id of an event confirming the payment, None for other events """
+    if event.type not in PAID_EVENTS:
+        return None
+    session = event.payload['data']['object']
+    # a completed session of a delayed payment method is not paid yet, async_payment_succeeded follows
+    if session.get('payment_status') != 'paid' or not str(session.get('client_reference_id', '')).isdigit():
+        return None
+    return int(session['client_reference_id'])
+
+
+def process_batch(batch_size):
+    """ Applies up to batch_size pending events in one transaction: rows locked by other workers are
+        skipped, paid orders of the whole batch are updated with one query (guest and user orders share
+        the Order table) and events are marked processed with another. Returns the number of events."""
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        order_ids = {paid_order_id(event) for event in events} - {None}
+        if order_ids:
+            Order.objects.filter(pk__in=order_ids, paid=False).update(paid=True, updated=timezone.now())
+        PaymentEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed=timezone.now())
+    return len(events)
+
+
+def process_events(batch_size=500):
+    """ processes pending events batch after batch until there are none, returns number of processed events """
+    processed = 0
+    while True:
+        count = process_batch(batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
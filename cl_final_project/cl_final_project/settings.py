@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'localflavor',
 
 ]
@@ -133,6 +134,43 @@ LOGIN_URL = '/login/'
 
 SESSION_COOKIE_AGE = 24 * 60 * 60
 
+# session storage, see https://docs.djangoproject.com/en/4.2/topics/http/sessions/#configuring-the-session-engine
+# 'db' - every visitor who touches the cart gets a django_session row, each change is an UPDATE
+# 'cached_db' - sessions are read from the cache, written to the cache and the database
+# 'cache' - no database at all, sessions are lost when the cache is flushed
+# 'signed_cookies' - no server side storage, the session travels in a cookie (max ~4kB)
+# The cached engines need a cache shared by all workers - with a per-process one a worker serves a stale cart
+# after another one changed it. 'db' is the default, 'cached_db' when local_settings.py configures CACHES
+# with a 'sessions' alias (memcached / redis); SESSION_MODE in local_settings.py overrides both.
+SESSION_MODE = 'db'
+
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# local memory caches are per process - use memcached / redis (in local_settings.py) when running more workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# checkout sessions: 'beer_haven.payments.StripeGateway' or the offline 'beer_haven.payments.StubGateway'
+PAYMENT_GATEWAY = 'beer_haven.payments.StripeGateway'
+# StripeGateway: request timeout (seconds) and network retries, StubGateway: latency (seconds)
+PAYMENT_GATEWAY_OPTIONS = {'timeout': 10, 'max_retries': 2}
+# signing secret of the Stripe webhook endpoint (whsec_...), set it in local_settings.py
+STRIPE_WEBHOOK_SECRET = ''
+
+# rows per recipe the pending vote counts are spread over, see beer_haven.votes
+RECIPE_VOTE_SHARDS = 8
+
+# cart payload limits, they keep the session (or cookie) small
+CART_MAX_ITEMS = 50
+CART_MAX_AMOUNT = 1000
+
+# recipes list pagination: 'offset' (?page=) or 'keyset' (?cursor=)
+RECIPES_PAGINATION = 'offset'
+# None (exact COUNT(*)), 'estimate' (query planner estimate) or 'cached' (COUNT(*) cached for a while)
+RECIPES_COUNT_STRATEGY = None
+
 
 try:
     from .local_settings import SECRET_KEY, DATABASES, EMAIL_BACKEND, EMAIL_HOST_USER, STRIPE_PUBLISHABLE_KEY, STRIPE_SECRET_KEY, STRIPE_API_VERSION
@@ -141,3 +179,24 @@ except ModuleNotFoundError:
     print("Fill missing data and try again!")
     exit(0)
 
+# optional settings
+try:
+    from .local_settings import CACHES
+    if 'sessions' in CACHES:
+        SESSION_MODE = 'cached_db'
+except ImportError:
+    pass
+
+try:
+    from .local_settings import SESSION_MODE
+except ImportError:
+    pass
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + SESSION_MODE
+SESSION_CACHE_ALIAS = 'sessions' if 'sessions' in CACHES else 'default'
+
+try:
+    from .local_settings import STRIPE_WEBHOOK_SECRET
+except ImportError:
+    pass
+
@@ -39,9 +39,12 @@ urlpatterns = [
 
     path('user-details/<int:pk>/', bh_views.UserDetails.as_view(), name='user-details'),
     path('dictionary/', bh_views.DictionaryView.as_view(), name='dictionary'),
+    path('dictionary/<slug:slug>/', bh_views.DictionaryEntryView.as_view(), name='dictionary_entry'),
     path('recipes/', bh_views.RecipesListView.as_view(), name='recipes'),
     path('recipe/<int:pk>/', bh_views.RecipeDetailsView.as_view(), name='recipe-details'),
+    path('recipe/<int:pk>/vote/', bh_views.RecipeVoteView.as_view(), name='recipe_vote'),
     path('search/', bh_views.SearchView.as_view(), name='search'),
+    path('search/autocomplete/', bh_views.AutocompleteView.as_view(), name='search_autocomplete'),
     path('edit-profile/', bh_views.EditProfile.as_view(), name='profile_change'),
     path('add-address/', bh_views.AddAddress.as_view(), name='add_address'),
     path('edit-address/<int:pk>/', bh_views.EditAddress.as_view(), name='address_change'),
@@ -56,6 +59,8 @@ urlpatterns = [
     path('payment-process/', bh_views.PaymentProcess.as_view(), name='payment_process'),
     path('payment-completed/', bh_views.PaymentCompleted.as_view(), name='payment_completed'),
     path('payment-canceled/', bh_views.PaymentCanceled.as_view(), name='payment_canceled'),
+    path('payment-webhook/', bh_views.StripeWebhookView.as_view(), name='payment_webhook'),
+    path('orders/export/', bh_views.OrderExportView.as_view(), name='order_export'),
 
 ]
 